@@ -1,9 +1,18 @@
 import os
-import pandas as pd
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 import streamlit as st
 from dotenv import load_dotenv
+from services.key_index import KeyIndex
 from services.s3_service import S3Manager
-from services.utils import format_file_size, format_file_info
+from services.utils import (
+    IMAGE_EXTENSIONS,
+    IMAGE_LABEL,
+    build_files_table,
+    format_file_size,
+    format_file_info,
+)
 from PIL import Image
 import io
 
@@ -14,6 +23,12 @@ AWS_ACCESS_KEY = os.getenv("ACCESS_KEY")  # Fixed typo: was "ACEESS_KEY"
 AWS_SECRET_KEY = os.getenv("SECRET_ACCESS_KEY")  # Fixed typo: was "SECRET_ACESS_KEY"
 AWS_REGION = "ap-south-1"  # Or your preferred region
 BUCKET_NAME = "my-photos-manager02"  # Replace with your bucket name
+UPLOAD_WORKERS = 8  # Files uploaded in parallel by "Upload all"
+# Objects larger than this are served through a presigned link instead of
+# being read into the app server's memory
+DOWNLOAD_BUFFER_LIMIT = int(os.getenv("DOWNLOAD_BUFFER_LIMIT_MB", "50")) * 1024 * 1024
+DOWNLOAD_LINK_EXPIRY = 3600  # Seconds a presigned download link stays valid
+SEARCH_RESULT_LIMIT = 50  # Keys offered by the download/delete search boxes
 
 
 # Initialize session state
@@ -30,10 +45,55 @@ def initialize_session_state():
             st.session_state.aws_connected = False
 
 
+def get_objects_snapshot():
+    """Return the bucket listing, fetching it at most once until invalidated"""
+    if st.session_state.get("objects_snapshot") is None:
+        st.session_state.objects_snapshot = st.session_state.s3_manager.list_objects(
+            BUCKET_NAME
+        )
+    return st.session_state.objects_snapshot
+
+
+def get_files_table():
+    """Return the file details table built from the current listing snapshot"""
+    if st.session_state.get("files_table") is None:
+        st.session_state.files_table = build_files_table(get_objects_snapshot())
+    return st.session_state.files_table
+
+
+def get_key_index():
+    """Return the key search index built from the current listing snapshot"""
+    if st.session_state.get("key_index") is None:
+        st.session_state.key_index = KeyIndex(
+            obj["Key"] for obj in get_objects_snapshot()
+        )
+    return st.session_state.key_index
+
+
+def invalidate_objects_snapshot():
+    """Drop the cached listing so the next rerun fetches a fresh one"""
+    st.session_state.objects_snapshot = None
+    st.session_state.files_table = None
+    st.session_state.key_index = None
+
+
+def search_keys(label, key):
+    """Render a search box and return the top matching keys with a caption"""
+    query = st.text_input(
+        label, key=key, placeholder="Type a prefix or any part of a name"
+    )
+    index = get_key_index()
+    matches = index.search(query.strip(), SEARCH_RESULT_LIMIT)
+    if len(matches) == SEARCH_RESULT_LIMIT and len(index) > SEARCH_RESULT_LIMIT:
+        st.caption(
+            f"Showing the first {SEARCH_RESULT_LIMIT} matches, refine the search to narrow down"
+        )
+    return matches
+
+
 def is_image_file(filename):
     """Check if file is an image based on extension"""
-    image_extensions = [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp"]
-    return any(filename.lower().endswith(ext) for ext in image_extensions)
+    return any(filename.lower().endswith(ext) for ext in IMAGE_EXTENSIONS)
 
 
 def display_image_preview(file_content, max_width=200):
@@ -73,6 +133,22 @@ def render_image_grid(objects):
 
                     with col:
                         try:
+                            if obj["Size"] > DOWNLOAD_BUFFER_LIMIT:
+                                # Too large to hold in memory here: no preview,
+                                # and the browser fetches it from S3 directly
+                                st.info(f"🖼️ {obj['Key']} is too large to preview")
+                                st.caption(f"📏 {format_file_size(obj['Size'])}")
+                                st.caption(
+                                    f"📅 {obj['LastModified'].strftime('%Y-%m-%d %H:%M')}"
+                                )
+                                st.link_button(
+                                    "💾 Save Image",
+                                    st.session_state.s3_manager.generate_download_url(
+                                        BUCKET_NAME, obj["Key"], DOWNLOAD_LINK_EXPIRY
+                                    ),
+                                )
+                                continue
+
                             # Download image for preview
                             file_content = st.session_state.s3_manager.download_file(
                                 BUCKET_NAME, obj["Key"]
@@ -115,32 +191,27 @@ def render_image_grid(objects):
     # Display all files in tabular format
     st.subheader("📋 All Files Details")
 
-    all_objects = image_objects + non_image_objects
-    if all_objects:
-        df_data = []
-        for obj in all_objects:
-            file_type = "🖼️ Image" if is_image_file(obj["Key"]) else "📄 File"
-            df_data.append(
-                {
-                    "Type": file_type,
-                    "File Name": obj["Key"],
-                    "Size": format_file_size(obj["Size"]),
-                    "Last Modified": obj["LastModified"].strftime("%Y-%m-%d %H:%M:%S"),
-                    "Storage Class": obj["StorageClass"],
-                }
-            )
-
-        df = pd.DataFrame(df_data)
-        st.dataframe(df, use_container_width=True)
+    df = get_files_table()
+    if len(df):
+        st.dataframe(
+            df,
+            use_container_width=True,
+            column_config={
+                "Last Modified": st.column_config.DatetimeColumn(
+                    format="YYYY-MM-DD HH:mm:ss"
+                )
+            },
+        )
 
         # Summary statistics
+        image_count = int((df["Type"] == IMAGE_LABEL).sum())
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Files", len(all_objects))
+            st.metric("Total Files", len(df))
         with col2:
-            st.metric("Images", len(image_objects))
+            st.metric("Images", image_count)
         with col3:
-            st.metric("Other Files", len(non_image_objects))
+            st.metric("Other Files", len(df) - image_count)
     else:
         st.info("No files found in this bucket")
 
@@ -150,15 +221,86 @@ def render_view_files_tab():
     st.subheader(f"Files in bucket: {BUCKET_NAME}")
 
     if st.button("🔄 Refresh"):
+        invalidate_objects_snapshot()
         st.rerun()  # Fixed: changed from st.experimental_rerun()
 
     try:
-        objects = st.session_state.s3_manager.list_objects(BUCKET_NAME)
+        objects = get_objects_snapshot()
         render_image_grid(objects)
     except Exception as e:
         st.error(f"Error loading files: {str(e)}")
 
 
+def upload_all_files(uploaded_files):
+    """Upload files through a bounded thread pool, showing aggregate and per-file progress
+
+    Returns a list of error messages, empty when every upload succeeded.
+    """
+    # Worker threads have no Streamlit script context, so they only touch
+    # plain objects and the main thread owns all widget updates.
+    s3_manager = st.session_state.s3_manager
+    total_bytes = sum(f.size for f in uploaded_files) or 1
+    transferred = [0] * len(uploaded_files)
+    lock = threading.Lock()
+
+    def upload(index, uploaded_file):
+        def callback(bytes_amount):
+            with lock:
+                transferred[index] += bytes_amount
+
+        uploaded_file.seek(0)
+        return s3_manager.upload_file(
+            BUCKET_NAME,
+            uploaded_file,
+            uploaded_file.name,
+            size=uploaded_file.size,
+            callback=callback,
+        )
+
+    overall_bar = st.progress(0.0)
+    status = st.empty()
+    with st.expander("Per-file progress"):
+        file_bars = [
+            st.progress(0.0, text=uploaded_file.name) for uploaded_file in uploaded_files
+        ]
+
+    start = time.monotonic()
+
+    def render_progress():
+        with lock:
+            snapshot = list(transferred)
+        done_bytes = sum(snapshot)
+        elapsed = max(time.monotonic() - start, 1e-6)
+        overall_bar.progress(min(done_bytes / total_bytes, 1.0))
+        status.write(
+            f"{format_file_size(done_bytes)} of {format_file_size(total_bytes)} "
+            f"at {format_file_size(done_bytes / elapsed)}/s"
+        )
+        for bar, uploaded_file, sent in zip(file_bars, uploaded_files, snapshot):
+            bar.progress(
+                min(sent / (uploaded_file.size or 1), 1.0), text=uploaded_file.name
+            )
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        futures = {
+            executor.submit(upload, index, uploaded_file): uploaded_file
+            for index, uploaded_file in enumerate(uploaded_files)
+        }
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=0.25)
+            render_progress()
+
+    for future, uploaded_file in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            errors.append(f"Error uploading {uploaded_file.name}: {str(e)}")
+    render_progress()
+    return errors
+
+
 # Upload files tab
 def render_upload_tab():
     st.subheader("Upload Files")
@@ -170,6 +312,22 @@ def render_upload_tab():
     )
 
     if uploaded_files:
+        total_size = sum(uploaded_file.size for uploaded_file in uploaded_files)
+        if st.button(
+            f"⬆️ Upload all ({len(uploaded_files)} files, {format_file_size(total_size)})",
+            type="primary",
+        ):
+            errors = upload_all_files(uploaded_files)
+            invalidate_objects_snapshot()
+            if errors:
+                st.warning(
+                    f"⚠️ Uploaded {len(uploaded_files) - len(errors)} out of {len(uploaded_files)} files"
+                )
+                for error in errors:
+                    st.error(error)
+            else:
+                st.rerun()
+
         for uploaded_file in uploaded_files:
             col1, col2 = st.columns([3, 1])
 
@@ -185,11 +343,15 @@ def render_upload_tab():
                         uploaded_file.seek(0)
                         try:
                             if st.session_state.s3_manager.upload_file(
-                                BUCKET_NAME, uploaded_file, uploaded_file.name
+                                BUCKET_NAME,
+                                uploaded_file,
+                                uploaded_file.name,
+                                size=uploaded_file.size,
                             ):
                                 st.success(
                                     f"✅ {uploaded_file.name} uploaded successfully!"
                                 )
+                                invalidate_objects_snapshot()
                                 st.rerun()  # Fixed: changed from st.experimental_rerun()
                         except Exception as e:
                             st.error(f"Upload error: {str(e)}")
@@ -200,10 +362,10 @@ def render_download_tab():
     st.subheader("Download Files")
 
     try:
-        objects = st.session_state.s3_manager.list_objects(BUCKET_NAME)
+        objects = get_objects_snapshot()
 
         if objects:
-            file_names = [obj["Key"] for obj in objects]
+            file_names = search_keys("🔍 Search files", "download_search")
             selected_file = st.selectbox("Select file to download", file_names)
 
             if selected_file:
@@ -211,7 +373,9 @@ def render_download_tab():
                     file_info = st.session_state.s3_manager.get_file_info(
                         BUCKET_NAME, selected_file
                     )
+                    buffered = True
                     if file_info:
+                        buffered = file_info["ContentLength"] <= DOWNLOAD_BUFFER_LIMIT
                         formatted_info = format_file_info(file_info)
                         col1, col2, col3 = st.columns(3)
                         with col1:
@@ -222,7 +386,7 @@ def render_download_tab():
                             st.metric("Storage Class", formatted_info["StorageClass"])
 
                     # Show preview for images
-                    if is_image_file(selected_file):
+                    if is_image_file(selected_file) and buffered:
                         if st.button("👁️ Preview Image"):
                             try:
                                 file_content = (
@@ -237,7 +401,20 @@ def render_download_tab():
                             except Exception as e:
                                 st.error(f"Preview error: {str(e)}")
 
-                    if st.button("📥 Download File"):
+                    if not buffered:
+                        # Too large to hold in memory here: let the browser
+                        # fetch it from S3 directly
+                        download_url = (
+                            st.session_state.s3_manager.generate_download_url(
+                                BUCKET_NAME, selected_file, DOWNLOAD_LINK_EXPIRY
+                            )
+                        )
+                        st.link_button("💾 Save File", download_url)
+                        st.caption(
+                            f"Large file: the link downloads directly from S3 and "
+                            f"expires in {DOWNLOAD_LINK_EXPIRY // 60} minutes."
+                        )
+                    elif st.button("📥 Download File"):
                         with st.spinner("Downloading..."):
                             file_content = st.session_state.s3_manager.download_file(
                                 BUCKET_NAME, selected_file
@@ -270,11 +447,17 @@ def render_delete_tab():
     st.warning("⚠️ Deletion is permanent and cannot be undone!")
 
     try:
-        objects = st.session_state.s3_manager.list_objects(BUCKET_NAME)
+        objects = get_objects_snapshot()
 
         if objects:
-            file_names = [obj["Key"] for obj in objects]
-            selected_files = st.multiselect("Select files to delete", file_names)
+            # Keep earlier picks selectable while the search narrows the options
+            previous = st.session_state.get("delete_selection", [])
+            matches = search_keys("🔍 Search files", "delete_search")
+            file_names = previous + [name for name in matches if name not in previous]
+            selected_files = st.multiselect(
+                "Select files to delete", file_names, default=previous
+            )
+            st.session_state.delete_selection = selected_files
 
             if selected_files:
                 st.write("Files to be deleted:")
@@ -309,6 +492,8 @@ def render_delete_tab():
                         for error in errors:
                             st.error(error)
 
+                    st.session_state.delete_selection = []
+                    invalidate_objects_snapshot()
                     st.rerun()  # Fixed: changed from st.experimental_rerun()
         else:
             st.info("No files available for deletion")
@@ -0,0 +1,103 @@
+"""Benchmark the decode-once resize DAG against per-variant full-size resizes
+
+Builds a 24 MP JPEG from photo.jpg, then for each strategy reports CPU time
+per image and the PSNR of every variant against the original output.
+
+Usage: python benchmarks/bench_cascade_resize.py
+"""
+
+import math
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from imaging.plan import load_plan
+from imaging.resize import (
+    decode_for_plan,
+    finish_variant,
+    fit_size,
+    pad_to_canvas,
+    run_resize_dag,
+)
+
+SOURCE_SIZE = (6000, 4000)
+ROUNDS = 3
+
+
+def make_source():
+    """A 24 MP camera-sized JPEG with some fine detail added back in"""
+    with Image.open(ROOT / "photo.jpg") as photo:
+        img = photo.convert("RGB").resize(SOURCE_SIZE, Image.Resampling.BICUBIC)
+    noise = Image.effect_noise(SOURCE_SIZE, 24).convert("RGB")
+    img = ImageChops.add(img, noise, scale=1.0, offset=-64).filter(ImageFilter.DETAIL)
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def full_size_variants(data, plan):
+    """The original path: full decode, then one LANCZOS resize per variant"""
+    with Image.open(BytesIO(data)) as img:
+        img = img.convert("RGB")
+        return {
+            variant.id: pad_to_canvas(
+                img.resize(fit_size(img.size, variant.size), Image.Resampling.LANCZOS),
+                variant.size,
+            )
+            for variant in plan.variants
+        }
+
+
+def cascade_variants(data, plan):
+    with Image.open(BytesIO(data)) as img:
+        original_size = img.size
+        base = decode_for_plan(img, plan)
+        return {
+            variant.id: finish_variant(variant, resized)
+            for node, resized in run_resize_dag(base, original_size, plan)
+            for variant in node.variants
+        }
+
+
+def psnr(a, b):
+    rms = math.sqrt(
+        sum(ImageStat.Stat(ImageChops.difference(a, b)).sum2) / (3 * a.width * a.height)
+    )
+    return float("inf") if rms == 0 else 20 * math.log10(255 / rms)
+
+
+def cpu_time(func, *args):
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        result = func(*args)
+    return (time.process_time() - start) / ROUNDS, result
+
+
+def main():
+    data = make_source()
+    plan = load_plan("lambda")
+
+    baseline_cpu, baseline = cpu_time(full_size_variants, data, plan)
+    cascade_cpu, cascaded = cpu_time(cascade_variants, data, plan)
+
+    print(f"source: {SOURCE_SIZE[0]}x{SOURCE_SIZE[1]} JPEG, {len(data) / 1e6:.1f} MB")
+    print(f"full-size resizes: {baseline_cpu * 1000:8.0f} ms CPU per image")
+    print(
+        f"decode-once cascade: {cascade_cpu * 1000:6.0f} ms CPU per image "
+        f"({baseline_cpu / cascade_cpu:.1f}x less)"
+    )
+    for variant_id in baseline:
+        name = "/".join(variant_id)
+        print(
+            f"  {name:<12} PSNR vs original output: {psnr(baseline[variant_id], cascaded[variant_id]):.1f} dB"
+        )
+
+
+if __name__ == "__main__":
+    main()
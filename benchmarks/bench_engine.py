@@ -0,0 +1,162 @@
+"""Benchmark the shared conversion engine behind lambda.py and the local script
+
+Per source: ImageEngine converts every corpus image (photo.jpg and a 24 MP
+camera-sized JPEG by default) with each plan, encoding variants serially or
+on a thread pool, into a local directory and into an in-memory S3. Reports
+wall time per image and where it goes (decode, resize, encode, write).
+
+Batch: every corpus file, copied --copies times, is converted through the
+local sink with the serial, thread and process executors, as
+image-script-local.py spreads files over workers.
+
+Usage: python benchmarks/bench_engine.py [--rounds N] [--workers N] [--copies N] [image ...]
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.bench_lambda_memory import make_source
+from benchmarks.local_s3 import LocalS3
+from imaging.engine import (
+    EXECUTOR_KINDS,
+    ImageEngine,
+    LocalSink,
+    S3Sink,
+    make_executor,
+)
+from imaging.metrics import sum_metrics
+from imaging.plan import load_plan
+
+CAMERA_SIZE = (6000, 4000)
+STAGES = ("decodeMs", "resizeMs", "encodeMs", "writeMs", "uploadMs")
+
+# Set in every batch worker by _init_batch_worker
+_batch_engine = None
+
+
+def build_corpus(paths, scratch):
+    """Corpus files on disk; the camera-sized source is generated into scratch"""
+    if paths:
+        return [Path(path) for path in paths]
+    camera = scratch / "camera.jpg"
+    camera.write_bytes(make_source(CAMERA_SIZE))
+    return [ROOT / "photo.jpg", camera]
+
+
+def per_source(corpus, plan, sink, variant_workers, rounds):
+    """Best-of-rounds wall ms per image and the stage totals of that round"""
+    executor = make_executor("thread" if variant_workers else "serial", variant_workers)
+    engine = ImageEngine(plan, sink, executor)
+    best = None
+    try:
+        for _ in range(rounds):
+            stages = defaultdict(float)
+            started = time.perf_counter()
+            for path in corpus:
+                conversion = engine.convert(path, engine.keys_for(path.stem))
+                for name, value in conversion.metrics.items():
+                    stages[name] += value
+                for name, value in sum_metrics(
+                    sample for _, sample in conversion.outputs
+                ).items():
+                    stages[name] += value
+            elapsed = (time.perf_counter() - started) * 1000 / len(corpus)
+            if best is None or elapsed < best[0]:
+                best = elapsed, {
+                    name: value / len(corpus) for name, value in stages.items()
+                }
+    finally:
+        executor.shutdown()
+    return best
+
+
+def _init_batch_worker(plan, output_dir):
+    global _batch_engine
+    _batch_engine = ImageEngine(plan, LocalSink(output_dir))
+
+
+def _convert_path(path):
+    _batch_engine.convert(
+        path, _batch_engine.keys_for(path.stem, f"{path.parent.name}/")
+    )
+    return len(_batch_engine.plan.variants)
+
+
+def batch(files, plan, output_dir, kind, workers):
+    """Wall seconds to convert every file with kind executor"""
+    executor = make_executor(kind, workers, _init_batch_worker, (plan, output_dir))
+    started = time.perf_counter()
+    try:
+        variants = sum(executor.map(_convert_path, files, chunksize=2))
+    finally:
+        executor.shutdown()
+    return time.perf_counter() - started, variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument(
+        "--workers", type=int, default=4, help="variant threads and batch workers"
+    )
+    parser.add_argument(
+        "--copies", type=int, default=4, help="copies of each file in the batch"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        scratch = Path(scratch)
+        corpus = build_corpus(args.images, scratch)
+        print(f"corpus: {', '.join(path.name for path in corpus)}")
+
+        print("\nper source (ms per image)")
+        print(
+            f"{'plan':<7} {'sink':<6} {'variants':<9} {'wall':>7} "
+            + " ".join(f"{stage[:-2]:>7}" for stage in STAGES)
+        )
+        for plan_name in ("lambda", "local"):
+            plan = load_plan(plan_name)
+            sinks = {
+                "local": lambda: LocalSink(scratch / "out"),
+                "s3": lambda: S3Sink(LocalS3(), "bench"),
+            }
+            for sink_name, make_sink in sinks.items():
+                for variant_workers in (0, args.workers):
+                    wall, stages = per_source(
+                        corpus, plan, make_sink(), variant_workers, args.rounds
+                    )
+                    mode = f"{variant_workers} thr" if variant_workers else "serial"
+                    print(
+                        f"{plan_name:<7} {sink_name:<6} {mode:<9} {wall:7.0f} "
+                        + " ".join(f"{stages.get(stage, 0):7.0f}" for stage in STAGES)
+                    )
+
+        batch_dir = scratch / "batch"
+        files = []
+        for copy in range(args.copies):
+            (batch_dir / str(copy)).mkdir(parents=True)
+            for path in corpus:
+                files.append(Path(shutil.copy(path, batch_dir / str(copy) / path.name)))
+        plan = load_plan("local")
+        print(f"\nbatch of {len(files)} files, local plan, {args.workers} workers")
+        for kind in EXECUTOR_KINDS:
+            elapsed, variants = batch(
+                files, plan, scratch / "batch-out", kind, args.workers
+            )
+            print(
+                f"  {kind:<8} {elapsed:6.2f} s  {len(files) / elapsed:6.2f} images/s  "
+                f"({variants} variants)"
+            )
+
+
+if __name__ == "__main__":
+    main()
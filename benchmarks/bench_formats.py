@@ -0,0 +1,131 @@
+"""Benchmark JPEG vs WebP vs AVIF variants: bytes saved, encode time and PSNR
+
+Encodes every variant size of the lambda plan from each corpus image with
+the plan's own settings, then reports per format the total bytes, the
+saving against JPEG, the encode time and the PSNR against the unencoded
+resize. ``--calibrate`` searches each format's quality for the PSNR that
+JPEG reaches at the plan's quality, which is how the plan was tuned.
+
+Usage: python benchmarks/bench_formats.py [--calibrate] [image ...]
+"""
+
+import math
+import sys
+import time
+from collections import defaultdict
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageStat, features
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from imaging.plan import load_plan
+from imaging.resize import decode_for_plan, finish_variant, run_resize_dag
+
+DEFAULT_CORPUS = [ROOT / "photo.jpg", *sorted((ROOT / "images").glob("*.jpg"))]
+CODECS = {"JPEG": "jpg", "WEBP": "webp", "AVIF": "avif"}
+
+
+def psnr(a, b):
+    rms = math.sqrt(
+        sum(ImageStat.Stat(ImageChops.difference(a, b)).sum2) / (3 * a.width * a.height)
+    )
+    return float("inf") if rms == 0 else 20 * math.log10(255 / rms)
+
+
+def encode(image, format, quality, options):
+    buffer = BytesIO()
+    start = time.perf_counter()
+    image.save(buffer, format=format, quality=quality, **options)
+    elapsed = time.perf_counter() - start
+    buffer.seek(0)
+    with Image.open(buffer) as decoded:
+        return buffer.getbuffer().nbytes, elapsed, psnr(image, decoded.convert("RGB"))
+
+
+def rendered_variants(corpus, plan):
+    """Yield (variant, image) for every plan variant of every corpus image"""
+    for path in corpus:
+        with Image.open(path) as img:
+            original_size = img.size
+            base = decode_for_plan(img, plan)
+            for node, resized in run_resize_dag(base, original_size, plan):
+                for variant in node.variants:
+                    yield variant, finish_variant(variant, resized)
+
+
+def report(corpus, plan):
+    totals = defaultdict(lambda: [0, 0.0, 0.0, 0])
+    for variant, image in rendered_variants(corpus, plan):
+        if not features.check(CODECS[variant.format]):
+            continue
+        size, elapsed, quality = encode(
+            image, variant.format, variant.quality, variant.options
+        )
+        total = totals[variant.format]
+        total[0] += size
+        total[1] += elapsed
+        total[2] += quality
+        total[3] += 1
+
+    jpeg_bytes = totals["JPEG"][0] or 1
+    print(f"{'format':<6} {'bytes':>10} {'vs JPEG':>8} {'encode':>10} {'PSNR':>7}")
+    for format, (size, elapsed, quality, count) in totals.items():
+        print(
+            f"{format:<6} {size:>10,} {(size - jpeg_bytes) / jpeg_bytes:>+8.0%} "
+            f"{elapsed * 1000 / count:>8.1f}ms {quality / count:>6.1f}dB"
+        )
+    for format in CODECS:
+        if format not in totals:
+            print(f"{format:<6} skipped: codec not available in this Pillow build")
+
+
+def calibrate(corpus, plan):
+    """Find the WebP/AVIF quality whose PSNR matches the plan's JPEG quality"""
+    images = [
+        image
+        for variant, image in rendered_variants(corpus, plan)
+        if variant.format == "JPEG"
+    ]
+    jpeg = next(variant for variant in plan.variants if variant.format == "JPEG")
+
+    def mean_psnr(format, quality, options):
+        return sum(
+            encode(image, format, quality, options)[2] for image in images
+        ) / len(images)
+
+    target = mean_psnr("JPEG", jpeg.quality, jpeg.options)
+    print(f"JPEG q{jpeg.quality}: {target:.2f} dB")
+    for format in ("WEBP", "AVIF"):
+        if not features.check(CODECS[format]):
+            print(f"{format}: codec not available in this Pillow build")
+            continue
+        options = next(
+            (variant.options for variant in plan.variants if variant.format == format),
+            {},
+        )
+        low, high = 1, 100
+        while low < high:
+            mid = (low + high) // 2
+            if mean_psnr(format, mid, options) < target:
+                low = mid + 1
+            else:
+                high = mid
+        print(f"{format}: q{low} reaches {mean_psnr(format, low, options):.2f} dB")
+
+
+def main():
+    args = sys.argv[1:]
+    calibrate_mode = "--calibrate" in args
+    corpus = [Path(arg) for arg in args if arg != "--calibrate"] or DEFAULT_CORPUS
+    plan = load_plan("lambda")
+    if calibrate_mode:
+        calibrate(corpus, plan)
+    else:
+        report(corpus, plan)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Benchmark KeyIndex build time and typeahead query latency on 1M keys
+
+Usage: python benchmarks/bench_key_index.py
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.key_index import KeyIndex
+
+KEY_COUNT = 1_000_000
+RESULT_LIMIT = 50
+WORDS = ["photo", "invoice", "report", "IMG", "holiday", "backup", "scan", "Team"]
+QUERIES = ["", "photos/2019", "img", "_0999", "holiday_0123456", "no-such-key", "a"]
+
+
+def make_keys(count):
+    rng = random.Random(0)
+    return [
+        f"{rng.choice(WORDS)}s/{2015 + i % 10}/{rng.choice(WORDS)}_{i:07d}"
+        f".{rng.choice(['jpg', 'png', 'pdf', 'txt'])}"
+        for i in range(count)
+    ]
+
+
+def main():
+    keys = make_keys(KEY_COUNT)
+
+    start = time.perf_counter()
+    index = KeyIndex(keys)
+    print(f"build: {time.perf_counter() - start:.2f}s for {len(index):,} keys")
+
+    print(f"{'query':>18} {'hits':>5} {'latency':>10}")
+    for query in QUERIES:
+        start = time.perf_counter()
+        hits = index.search(query, RESULT_LIMIT)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{query!r:>18} {len(hits):>5} {elapsed:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Report peak memory of one lambda_handler invocation per source size
+
+Each measurement runs in a fresh interpreter against the in-memory S3
+stand-in, so the numbers match what a cold Lambda container would see.
+
+Usage: python benchmarks/bench_lambda_memory.py [path/to/lambda.py]
+"""
+
+import importlib.util
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageChops, ImageFilter
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SOURCE_SIZES = [(4000, 3000), (6000, 4000), (9000, 6000)]
+
+
+def make_source(size):
+    with Image.open(ROOT / "photo.jpg") as photo:
+        img = photo.convert("RGB").resize(size, Image.Resampling.BICUBIC)
+    noise = Image.effect_noise(size, 24).convert("RGB")
+    img = ImageChops.add(img, noise, offset=-64).filter(ImageFilter.DETAIL)
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def max_rss_mb():
+    """Peak RSS of this process; unlike ru_maxrss it is not inherited across exec"""
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(module_path, source_path):
+    """Invoke the handler once and print baseline and peak RSS as JSON"""
+    from benchmarks.local_s3 import LocalS3
+
+    spec = importlib.util.spec_from_file_location("lambda_under_test", module_path)
+    lambda_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(lambda_module)
+
+    s3 = LocalS3()
+    s3.put("source-bucket", "photo.jpg", Path(source_path).read_bytes())
+    lambda_module._s3_client = s3
+
+    event = {
+        "Records": [
+            {
+                "s3": {
+                    "bucket": {"name": "source-bucket"},
+                    "object": {"key": "photo.jpg"},
+                }
+            }
+        ]
+    }
+    baseline = max_rss_mb()
+    with open("/dev/null", "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            result = lambda_module.lambda_handler(event, None)
+        finally:
+            sys.stdout = stdout
+    print(
+        json.dumps(
+            {"status": result["statusCode"], "baseline": baseline, "peak": max_rss_mb()}
+        )
+    )
+
+
+def main():
+    module_path = sys.argv[1] if len(sys.argv) > 1 else str(ROOT / "lambda.py")
+    print(f"module: {module_path}")
+    print(f"{'source':>10} {'bytes':>8} {'baseline':>10} {'peak':>9} {'handler':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in SOURCE_SIZES:
+            source_path = Path(tmp) / f"{size[0]}x{size[1]}.jpg"
+            source_path.write_bytes(make_source(size))
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", module_path, str(source_path)],
+                check=True,
+                capture_output=True,
+                text=True,
+                cwd=ROOT,
+            ).stdout
+            stats = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{size[0]}x{size[1]:<5} {source_path.stat().st_size / 1e6:>6.1f}MB "
+                f"{stats['baseline']:>8.0f}MB {stats['peak']:>7.0f}MB "
+                f"{stats['peak'] - stats['baseline']:>7.0f}MB"
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        run_child(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,339 @@
+"""Load-test lambda_handler locally with simulated S3 put events
+
+Each worker process stands in for one Lambda container: it imports lambda.py
+itself (so its first invocation is a cold start), talks to its own in-memory
+S3 and is handed each event with its sources. Every record names a source
+key of its own and the dedup index is off, so each record is a full
+conversion rather than a skip or a copy. Workers are held to the CPU share
+and memory a function of --memory MB would get. CPU follows Lambda's allocation of one
+vCPU per 1769 MB and is enforced by pausing workers that exceed it; memory is
+enforced on RSS, so an undersized setting gets killed like a real one and
+the next event lands on a fresh cold container.
+
+Reports images/sec, p50/p95 latency per invocation (all and warm only) and
+peak RSS per invocation, for sizing the function's memory from data.
+
+Usage: python benchmarks/bench_lambda_throughput.py [--memory MB[,MB...]] [--workers N]
+           [--invocations N] [--records-per-event N] [--corpus DIR] [--no-cpu-cap]
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import signal
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.bench_lambda_memory import make_source, max_rss_mb
+from benchmarks.local_s3 import LocalS3, s3_put_record
+
+SOURCE_BUCKET = "source-bucket"
+# Lambda allocates CPU in proportion to memory, one vCPU at 1769 MB
+MB_PER_VCPU = 1769
+MAX_VCPUS = 6
+THROTTLE_TICK = 0.01
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+SYNTHETIC_SIZES = [(4000, 3000), (3000, 2000), (6000, 4000)]
+
+
+def load_corpus(directory, count):
+    """Images from directory, or count synthetic camera-sized JPEGs"""
+    if directory:
+        paths = sorted(
+            path
+            for path in Path(directory).rglob("*")
+            if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp")
+        )
+        return {f"uploads/{path.name}": path.read_bytes() for path in paths}
+    return {
+        f"uploads/synthetic-{index:02d}.jpg": make_source(
+            SYNTHETIC_SIZES[index % len(SYNTHETIC_SIZES)]
+        )
+        for index in range(count)
+    }
+
+
+def reset_peak_rss():
+    """Restart VmHWM so the next reading covers one invocation only"""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+def cpu_seconds(pid):
+    """User plus system CPU time of every thread in pid"""
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+class ContainerLimits(threading.Thread):
+    """Hold worker processes to a Lambda memory setting
+
+    CPU is a token bucket of vcpus CPU-seconds per wall second: a worker that
+    runs out is paused with SIGSTOP until it has earned time back. A worker
+    whose RSS exceeds memory_mb is killed, as Lambda does.
+    """
+
+    def __init__(self, vcpus, memory_mb):
+        super().__init__(daemon=True)
+        self.vcpus = vcpus
+        self.memory_mb = memory_mb
+        self.killed = []
+        self.stopped = threading.Event()
+        self._pids = {}
+        self._lock = threading.Lock()
+
+    def watch(self, pid):
+        with self._lock:
+            self._pids[pid] = {"used": 0.0, "tokens": 0.0, "paused": False}
+
+    def run(self):
+        last = time.perf_counter()
+        while not self.stopped.wait(THROTTLE_TICK):
+            now = time.perf_counter()
+            with self._lock:
+                watched = list(self._pids.items())
+            for pid, state in watched:
+                try:
+                    self._check(pid, state, now - last)
+                except (OSError, ValueError):
+                    # Exited between ticks
+                    with self._lock:
+                        self._pids.pop(pid, None)
+            last = now
+        for pid, state in self._pids.items():
+            if state["paused"]:
+                self._signal(pid, signal.SIGCONT)
+
+    def _check(self, pid, state, elapsed):
+        if rss_mb(pid) > self.memory_mb:
+            self._signal(pid, signal.SIGKILL)
+            self.killed.append(pid)
+            raise ProcessLookupError(pid)
+        if self.vcpus is None:
+            return
+        total = cpu_seconds(pid)
+        # Bursts are allowed up to a tenth of a second of budget
+        state["tokens"] = min(
+            state["tokens"] + self.vcpus * elapsed - (total - state["used"]),
+            self.vcpus * 0.1,
+        )
+        state["used"] = total
+        if state["tokens"] < 0 and not state["paused"]:
+            self._signal(pid, signal.SIGSTOP)
+            state["paused"] = True
+        elif state["tokens"] >= 0 and state["paused"]:
+            self._signal(pid, signal.SIGCONT)
+            state["paused"] = False
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def worker(memory_mb, corpus, tasks, results):
+    """One simulated container: import lambda.py, then serve events until None
+
+    Tasks are (event, {record key: corpus key}); each record's source is
+    written under its own key before the invocation.
+    """
+    os.environ["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"] = str(memory_mb)
+    os.environ["DEDUP_INDEX"] = "off"
+    sys.stdout = open(os.devnull, "w")
+
+    import importlib
+
+    lambda_module = importlib.import_module("lambda")
+    s3 = LocalS3()
+    lambda_module._s3_client = s3
+
+    cold = True
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        event, sources = task
+        for key, corpus_key in sources.items():
+            s3.put(SOURCE_BUCKET, key, corpus[corpus_key])
+        reset_peak_rss()
+        started = time.perf_counter()
+        try:
+            response = lambda_module.lambda_handler(event, None)
+            ok = sum(result["status"] == "ok" for result in response["results"])
+            errors = [
+                result.get("error") or result["status"]
+                for result in response["results"]
+                if result["status"] != "ok"
+            ]
+        except MemoryError:
+            ok, errors = 0, ["MemoryError"]
+        # Sources and outputs are not needed again, and would only grow RSS
+        s3.objects.clear()
+        results.put(
+            {
+                "pid": os.getpid(),
+                "cold": cold,
+                "ms": (time.perf_counter() - started) * 1000,
+                "images": ok,
+                "records": len(event["Records"]),
+                "peak_rss_mb": max_rss_mb(),
+                "errors": errors,
+            }
+        )
+        cold = False
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def run(memory_mb, events, corpus, args):
+    """Drain events through args.workers simulated containers of memory_mb"""
+    vcpus = min(memory_mb / MB_PER_VCPU, MAX_VCPUS)
+    context = multiprocessing.get_context("spawn")
+    tasks, results = context.Queue(), context.Queue()
+    limits = ContainerLimits(None if args.no_cpu_cap else vcpus, memory_mb)
+    limits.start()
+
+    def start_worker():
+        process = context.Process(
+            target=worker, args=(memory_mb, corpus, tasks, results)
+        )
+        process.start()
+        limits.watch(process.pid)
+        return process
+
+    started = time.perf_counter()
+    workers = [start_worker() for _ in range(args.workers)]
+    for task in events:
+        tasks.put(task)
+
+    # An invocation whose container was killed never reports back; Lambda
+    # would start a fresh (cold) container for the next event
+    samples = []
+    while len(samples) + len(limits.killed) < len(events):
+        try:
+            samples.append(results.get(timeout=THROTTLE_TICK * 10))
+        except queue.Empty:
+            pass
+        for index, process in enumerate(workers):
+            if process.is_alive():
+                continue
+            if process.exitcode != -signal.SIGKILL:
+                # Not killed for memory, so its event will never be
+                # accounted for; waiting on it would hang the run
+                for other in workers:
+                    other.kill()
+                limits.stopped.set()
+                raise RuntimeError(
+                    f"worker {process.pid} exited with code {process.exitcode}"
+                )
+            workers[index] = start_worker()
+    elapsed = time.perf_counter() - started
+    for _ in workers:
+        tasks.put(None)
+    for process in workers:
+        process.join(timeout=5)
+    limits.stopped.set()
+    killed = len(limits.killed)
+
+    print(
+        f"memory {memory_mb} MB ({vcpus:.2f} vCPU"
+        f"{', uncapped' if args.no_cpu_cap else ''}), {args.workers} workers, "
+        f"{len(corpus)} source images, {args.records_per_event} record(s) per event"
+    )
+    if not samples:
+        print(f"no invocation completed; {killed} killed for exceeding memory")
+        return
+    latencies = [sample["ms"] for sample in samples]
+    warm = [sample["ms"] for sample in samples if not sample["cold"]] or latencies
+    images = sum(sample["images"] for sample in samples)
+    failed = sum(sample["records"] - sample["images"] for sample in samples)
+    peaks = [sample["peak_rss_mb"] for sample in samples]
+    print(f"invocations  {len(samples)} ({sum(s['cold'] for s in samples)} cold)")
+    print(
+        f"images/sec   {images / elapsed:.2f} ({images} converted, {failed} not converted)"
+    )
+    print(
+        f"latency      p50 {percentile(latencies, 0.5):.0f} ms, "
+        f"p95 {percentile(latencies, 0.95):.0f} ms"
+    )
+    print(
+        f"warm latency p50 {percentile(warm, 0.5):.0f} ms, "
+        f"p95 {percentile(warm, 0.95):.0f} ms"
+    )
+    print(
+        f"peak RSS     median {statistics.median(peaks):.0f} MB, "
+        f"max {max(peaks):.0f} MB of {memory_mb} MB"
+    )
+    errors = sorted({error for sample in samples for error in sample["errors"]})
+    for error in errors[:5]:
+        print(f"error        {error}")
+    if killed:
+        print(f"killed       {killed} invocation(s) for exceeding {memory_mb} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--memory",
+        default="1024",
+        help="function memory in MB; a comma-separated list compares settings",
+    )
+    parser.add_argument("--workers", type=int, default=4, help="concurrent containers")
+    parser.add_argument("--invocations", type=int, default=40)
+    parser.add_argument("--records-per-event", type=int, default=1)
+    parser.add_argument("--corpus", help="directory of images (default: synthetic)")
+    parser.add_argument("--corpus-size", type=int, default=6)
+    parser.add_argument("--no-cpu-cap", action="store_true")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, args.corpus_size)
+    keys = list(corpus)
+    events = []
+    for index in range(args.invocations):
+        # A source key (and so variant keys) of its own for every record: a
+        # container that served the same key before would skip it as current
+        sources = {}
+        for offset in range(args.records_per_event):
+            corpus_key = keys[(index * args.records_per_event + offset) % len(keys)]
+            path = Path(corpus_key)
+            key = f"{path.parent}/{path.stem}-{index:04d}-{offset:02d}{path.suffix}"
+            sources[key] = corpus_key
+        events.append(
+            (
+                {"Records": [s3_put_record(SOURCE_BUCKET, key) for key in sources]},
+                sources,
+            )
+        )
+
+    for position, memory_mb in enumerate(args.memory.split(",")):
+        if position:
+            print()
+        run(int(memory_mb), events, corpus, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Benchmark encoder presets: encode time against bytes and PSNR
+
+Renders every lambda plan size from each corpus image (photo.jpg, the
+images folder and a synthetic detailed camera shot by default), then encodes
+each render with every preset of every available format at the same
+quality. JPEG also gets the settings the converters used before presets:
+quality 85 with Pillow's defaults (lambda) and quality 100 with optimize
+(local script).
+
+Usage: python benchmarks/bench_presets.py [--quality Q] [image ...]
+"""
+
+import argparse
+import sys
+import time
+from collections import defaultdict
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, features
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.bench_formats import DEFAULT_CORPUS
+from benchmarks.bench_lambda_memory import make_source
+from imaging.plan import FORMAT_CODECS, Variant, load_plan
+from imaging.presets import ENCODER_PRESETS
+from imaging.quality import psnr
+from imaging.resize import decode_for_plan, finish_variant, run_resize_dag
+
+ROUNDS = 3
+LEGACY_JPEG = {
+    "q85 default": {"quality": 85, "options": {}},
+    "q100 optimize": {"quality": 100, "options": {"optimize": True}},
+}
+
+
+def renders(corpus, plan):
+    """Every distinct plan size rendered from every corpus image"""
+    images = []
+    for source in corpus:
+        with Image.open(source) as img:
+            original_size = img.size
+            base = decode_for_plan(img, plan)
+            for node, resized in run_resize_dag(base, original_size, plan):
+                images.append(finish_variant(node.variants[0], resized))
+    return images
+
+
+def measure(image, variant):
+    """Best-of-ROUNDS encode time, bytes and PSNR of variant's settings"""
+    kwargs = variant.save_kwargs()
+    elapsed = float("inf")
+    for _ in range(ROUNDS):
+        buffer = BytesIO()
+        started = time.perf_counter()
+        image.save(buffer, **kwargs)
+        elapsed = min(elapsed, time.perf_counter() - started)
+    buffer.seek(0)
+    with Image.open(buffer) as decoded:
+        return elapsed, buffer.getbuffer().nbytes, psnr(image, decoded.convert("RGB"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("images", nargs="*", type=Path)
+    args = parser.parse_args()
+
+    corpus = args.images or [*DEFAULT_CORPUS, BytesIO(make_source((4000, 3000)))]
+    images = renders(corpus, load_plan("lambda"))
+    print(f"{len(images)} renders from {len(corpus)} images, quality {args.quality}")
+
+    rows = []
+    for format_name, presets in ENCODER_PRESETS.items():
+        if not features.check(FORMAT_CODECS[format_name]):
+            continue
+        settings = {
+            name: {"quality": args.quality, "options": {}, "preset": name}
+            for name in presets
+        }
+        if format_name == "JPEG":
+            settings = {**LEGACY_JPEG, **settings}
+        for name, setting in settings.items():
+            variant = Variant("bench", 1, 1, format=format_name, **setting)
+            totals = defaultdict(float)
+            for image in images:
+                elapsed, nbytes, quality = measure(image, variant)
+                totals["ms"] += elapsed * 1000
+                totals["bytes"] += nbytes
+                totals["psnr"] += quality
+            rows.append((format_name, name, totals))
+
+    print(f"{'format':<6} {'preset':<14} {'encode':>10} {'bytes':>11} {'PSNR':>7}")
+    for format_name, name, totals in rows:
+        print(
+            f"{format_name:<6} {name:<14} {totals['ms'] / len(images):>8.1f}ms "
+            f"{int(totals['bytes']):>11,} {totals['psnr'] / len(images):>6.2f}dB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare one-record S3 invocations with SQS batches through lambda_handler
+
+Queues a corpus of JPEGs (plus one missing object, to exercise
+batchItemFailures) on the in-memory queue and drains it through a single warm
+container at several batch sizes. Every invocation saved is one fewer
+potential cold start on a real deployment.
+
+Usage: python benchmarks/bench_sqs_batches.py [images]
+"""
+
+import contextlib
+import importlib
+import io
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.local_s3 import LocalS3, s3_put_record
+from benchmarks.local_sqs import LocalSQS
+
+SOURCE_SIZE = (3000, 2000)
+BATCH_SIZES = [1, 5, 10]
+
+
+def make_corpus(count):
+    """count distinct JPEGs, so the idempotency check never short-circuits"""
+    with Image.open(ROOT / "photo.jpg") as photo:
+        base = photo.convert("RGB").resize(SOURCE_SIZE, Image.Resampling.BICUBIC)
+    corpus = {}
+    for index in range(count):
+        buffer = BytesIO()
+        base.rotate(index, fillcolor=(255, 255, 255)).save(
+            buffer, format="JPEG", quality=90
+        )
+        corpus[f"uploads/photo-{index:03d}.jpg"] = buffer.getvalue()
+    return corpus
+
+
+def run(lambda_module, corpus, batch_size):
+    s3 = LocalS3()
+    for key, data in corpus.items():
+        s3.put("source-bucket", key, data)
+    lambda_module._s3_client = s3
+    lambda_module._dedup_index = None
+    records = [
+        s3_put_record("source-bucket", key, data) for key, data in corpus.items()
+    ]
+    records.append(s3_put_record("source-bucket", "uploads/missing.jpg"))
+
+    if batch_size is None:
+        # Plain S3 trigger: one invocation per notification
+        started = time.perf_counter()
+        for record in records:
+            lambda_module.lambda_handler({"Records": [record]}, None)
+        return time.perf_counter() - started, {"invocations": len(records)}
+
+    queue = LocalSQS(batch_size=batch_size, max_receive_count=2)
+    queue.send_s3_records(records)
+    started = time.perf_counter()
+    stats = queue.deliver(lambda_module.lambda_handler)
+    return time.perf_counter() - started, stats
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    corpus = make_corpus(count)
+    lambda_module = importlib.import_module("lambda")
+    print(
+        f"{count} images + 1 missing object, MAX_RECORD_WORKERS={lambda_module.MAX_RECORD_WORKERS}"
+    )
+    print(
+        f"{'mode':>10} {'invocations':>12} {'seconds':>8} {'images/s':>9} {'dead':>5}"
+    )
+    for batch_size in [None] + BATCH_SIZES:
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds, stats = run(lambda_module, corpus, batch_size)
+        mode = "s3" if batch_size is None else f"sqs x{batch_size}"
+        print(
+            f"{mode:>10} {stats['invocations']:>12} {seconds:>8.2f} "
+            f"{count / seconds:>9.1f} {stats.get('dead_lettered', '-'):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
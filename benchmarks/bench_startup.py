@@ -0,0 +1,175 @@
+"""Track lambda.py cold-start cost for each startup mode
+
+Every sample imports the module in a fresh interpreter and reports the
+import time, RSS after import, the Pillow plugins loaded after import and
+after the first invocation, that invocation against the in-memory S3
+stand-in, and the time to create the S3 client (no network involved).
+Medians are printed per mode; --history appends them, tagged with the
+current commit, to a JSON-lines file so the numbers can be compared
+release by release.
+
+Usage: python benchmarks/bench_startup.py [--samples N] [--history FILE]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+MODES = ["full", "lean"]
+
+
+def rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def loaded_plugins():
+    return sum(
+        1
+        for name in sys.modules
+        if name.startswith("PIL.") and name.endswith("ImagePlugin")
+    )
+
+
+def run_child():
+    """Import lambda.py, invoke it once and print the measurements as JSON"""
+    started = time.perf_counter()
+    import importlib
+
+    lambda_module = importlib.import_module("lambda")
+    import_ms = (time.perf_counter() - started) * 1000
+    import_rss = rss_mb()
+    plugins = loaded_plugins()
+    boto3_at_import = "boto3" in sys.modules
+
+    from benchmarks.local_s3 import LocalS3, s3_put_record
+
+    s3 = LocalS3()
+    data = (ROOT / "photo.jpg").read_bytes()
+    s3.put("source-bucket", "photo.jpg", data)
+    lambda_module._s3_client = s3
+    started = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            result = lambda_module.lambda_handler(
+                {"Records": [s3_put_record("source-bucket", "photo.jpg", data)]}, None
+            )
+        finally:
+            sys.stdout = stdout
+    first_invocation_ms = (time.perf_counter() - started) * 1000
+    # Saving a format outside Pillow's preinit set loads every remaining plugin
+    plugins_after_call = loaded_plugins()
+
+    # What a real deployment pays on top for its S3 client, minus the network
+    lambda_module._s3_client = None
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    started = time.perf_counter()
+    lambda_module.get_s3_client()
+    s3_client_ms = (time.perf_counter() - started) * 1000
+
+    print(
+        json.dumps(
+            {
+                "status": result["statusCode"],
+                "import_ms": import_ms,
+                "import_rss_mb": import_rss,
+                "pil_plugins": plugins,
+                "pil_plugins_after_call": plugins_after_call,
+                "boto3_at_import": boto3_at_import,
+                "first_invocation_ms": first_invocation_ms,
+                "s3_client_ms": s3_client_ms,
+            }
+        )
+    )
+
+
+def sample(mode):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child"],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        env={**os.environ, "LAMBDA_STARTUP": mode},
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=ROOT,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--history", type=Path)
+    args = parser.parse_args()
+
+    print(
+        f"{'mode':>5} {'import':>9} {'rss':>8} {'plugins':>8} {'boto3':>6} "
+        f"{'1st call':>9} {'client':>8}"
+    )
+    for mode in MODES:
+        samples = [sample(mode) for _ in range(args.samples)]
+        medians = {
+            key: statistics.median(s[key] for s in samples)
+            for key in (
+                "import_ms",
+                "import_rss_mb",
+                "first_invocation_ms",
+                "s3_client_ms",
+            )
+        }
+        plugins = (
+            f"{samples[-1]['pil_plugins']}/{samples[-1]['pil_plugins_after_call']}"
+        )
+        boto3_at_import = samples[-1]["boto3_at_import"]
+        print(
+            f"{mode:>5} {medians['import_ms']:>7.0f}ms {medians['import_rss_mb']:>6.1f}MB "
+            f"{plugins:>8} {'yes' if boto3_at_import else 'no':>6} "
+            f"{medians['first_invocation_ms']:>7.0f}ms {medians['s3_client_ms']:>6.0f}ms"
+        )
+        if args.history:
+            with open(args.history, "a") as history:
+                history.write(
+                    json.dumps(
+                        {
+                            "recorded": datetime.now(timezone.utc).isoformat(),
+                            "commit": current_commit(),
+                            "mode": mode,
+                            "samples": args.samples,
+                            "pil_plugins": plugins,
+                            **{key: round(value, 1) for key, value in medians.items()},
+                        }
+                    )
+                    + "\n"
+                )
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["--child"]:
+        run_child()
+    else:
+        main()
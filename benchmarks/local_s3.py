@@ -0,0 +1,140 @@
+"""In-memory stand-in for the S3 client calls made by lambda.py
+
+Used by the benchmarks so the handler can run locally without AWS.
+"""
+
+import hashlib
+import threading
+from datetime import datetime, timezone
+from io import BytesIO
+from urllib.parse import quote_plus
+
+from botocore.exceptions import ClientError
+
+
+class LocalStreamingBody:
+    """Minimal botocore StreamingBody look-alike"""
+
+    def __init__(self, data):
+        self._stream = BytesIO(data)
+
+    def read(self, amt=None):
+        return self._stream.read(amt)
+
+    def readinto(self, b):
+        return self._stream.readinto(b)
+
+    def iter_chunks(self, chunk_size=1024 * 1024):
+        while True:
+            chunk = self._stream.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._stream.close()
+
+
+class LocalS3:
+    """Thread-safe in-memory buckets exposing the boto3 client methods we call"""
+
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def put(self, bucket, key, data, metadata=None, content_type="binary/octet-stream"):
+        """Seed an object directly, bypassing the client API"""
+        with self._lock:
+            self.objects[(bucket, key)] = {
+                "Body": bytes(data),
+                "Metadata": dict(metadata or {}),
+                "ContentType": content_type,
+                "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+                "LastModified": datetime.now(timezone.utc),
+            }
+
+    def _get(self, bucket, key, operation):
+        with self._lock:
+            obj = self.objects.get((bucket, key))
+        if obj is None:
+            raise ClientError(
+                {
+                    "Error": {
+                        "Code": "404" if operation == "HeadObject" else "NoSuchKey"
+                    }
+                },
+                operation,
+            )
+        return obj
+
+    def get_object(self, Bucket, Key, **kwargs):
+        obj = self._get(Bucket, Key, "GetObject")
+        return {
+            "Body": LocalStreamingBody(obj["Body"]),
+            "ContentLength": len(obj["Body"]),
+            "ContentType": obj["ContentType"],
+            "ETag": obj["ETag"],
+            "Metadata": obj["Metadata"],
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        obj = self._get(Bucket, Key, "HeadObject")
+        return {
+            "ContentLength": len(obj["Body"]),
+            "ContentType": obj["ContentType"],
+            "ETag": obj["ETag"],
+            "LastModified": obj["LastModified"],
+            "Metadata": obj["Metadata"],
+        }
+
+    def put_object(
+        self,
+        Bucket,
+        Key,
+        Body,
+        ContentType="binary/octet-stream",
+        Metadata=None,
+        **kwargs,
+    ):
+        data = Body.read() if hasattr(Body, "read") else Body
+        self.put(Bucket, Key, data, Metadata, ContentType)
+        return {"ETag": self.objects[(Bucket, Key)]["ETag"]}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def copy_object(
+        self,
+        Bucket,
+        Key,
+        CopySource,
+        MetadataDirective="COPY",
+        ContentType=None,
+        Metadata=None,
+        **kwargs,
+    ):
+        obj = self._get(CopySource["Bucket"], CopySource["Key"], "CopyObject")
+        if_match = kwargs.get("CopySourceIfMatch")
+        if if_match is not None and if_match.strip('"') != obj["ETag"].strip('"'):
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "CopyObject")
+        if MetadataDirective == "REPLACE":
+            content_type = ContentType or "binary/octet-stream"
+            metadata = Metadata
+        else:
+            content_type, metadata = obj["ContentType"], obj["Metadata"]
+        self.put(Bucket, Key, obj["Body"], metadata, content_type)
+        return {"CopyObjectResult": {"ETag": self.objects[(Bucket, Key)]["ETag"]}}
+
+
+def s3_put_record(bucket, key, data=None):
+    """S3 event notification record for an object written to bucket/key"""
+    obj = {"key": quote_plus(key)}
+    if data is not None:
+        obj.update(size=len(data), eTag=hashlib.md5(data).hexdigest())
+    return {
+        "eventSource": "aws:s3",
+        "eventName": "ObjectCreated:Put",
+        "s3": {"bucket": {"name": bucket}, "object": obj},
+    }
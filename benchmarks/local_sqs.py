@@ -0,0 +1,96 @@
+"""In-memory stand-in for an SQS queue feeding lambda.py
+
+Delivers batches to a handler the way Lambda's SQS event source mapping does
+with ReportBatchItemFailures: messages listed in batchItemFailures (or the
+whole batch, if the handler raises) go back on the queue, and messages that
+keep failing end up in a dead-letter list.
+"""
+
+import json
+import threading
+import uuid
+from collections import deque
+
+
+class LocalSQS:
+    """Thread-safe FIFO of messages with receive counts and a dead-letter list"""
+
+    def __init__(self, batch_size=10, max_receive_count=3):
+        self.batch_size = batch_size
+        self.max_receive_count = max_receive_count
+        self.dead_letters = []
+        self._messages = deque()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages)
+
+    def send_message(self, MessageBody, **kwargs):
+        message = {
+            "messageId": str(uuid.uuid4()),
+            "body": MessageBody,
+            "receiveCount": 0,
+        }
+        with self._lock:
+            self._messages.append(message)
+        return {"MessageId": message["messageId"]}
+
+    def send_s3_records(self, records):
+        """Queue one S3 notification per record, as an S3 -> SQS trigger would"""
+        for record in records:
+            self.send_message(json.dumps({"Records": [record]}))
+
+    def receive_batch(self):
+        """Take up to batch_size messages and wrap them in a Lambda SQS event"""
+        with self._lock:
+            batch = [
+                self._messages.popleft()
+                for _ in range(min(self.batch_size, len(self._messages)))
+            ]
+        for message in batch:
+            message["receiveCount"] += 1
+        return batch, {
+            "Records": [
+                {
+                    "messageId": message["messageId"],
+                    "body": message["body"],
+                    "eventSource": "aws:sqs",
+                    "attributes": {
+                        "ApproximateReceiveCount": str(message["receiveCount"])
+                    },
+                }
+                for message in batch
+            ]
+        }
+
+    def settle(self, batch, failed_ids):
+        """Drop delivered messages and requeue (or dead-letter) failed ones"""
+        with self._lock:
+            for message in batch:
+                if message["messageId"] not in failed_ids:
+                    continue
+                if message["receiveCount"] >= self.max_receive_count:
+                    self.dead_letters.append(message)
+                else:
+                    self._messages.append(message)
+
+    def deliver(self, handler, context=None):
+        """Invoke handler with batches until the queue drains; return counts"""
+        stats = {"invocations": 0, "delivered": 0, "failed": 0}
+        while len(self):
+            batch, event = self.receive_batch()
+            try:
+                response = handler(event, context)
+                failed_ids = {
+                    failure["itemIdentifier"]
+                    for failure in (response or {}).get("batchItemFailures") or []
+                }
+            except Exception:
+                failed_ids = {message["messageId"] for message in batch}
+            self.settle(batch, failed_ids)
+            stats["invocations"] += 1
+            stats["delivered"] += len(batch) - len(failed_ids)
+            stats["failed"] += len(failed_ids)
+        stats["dead_lettered"] = len(self.dead_letters)
+        return stats
@@ -1,98 +1,264 @@
+import argparse
+import math
+import os
+import sys
+import time
 from PIL import Image
 from pathlib import Path
+from imaging.engine import EXECUTOR_KINDS, ImageEngine, LocalSink, make_executor
+from imaging.manifest import ConversionManifest, file_sha256
+from imaging.plan import load_plan
 
-# Device viewport dimensions (width x height)
-DEVICE_VIEWPORTS = {
-    'laptop': (1920, 1080),    # Standard laptop/desktop
-    'tablet': (1024, 768),     # Standard tablet (landscape)
-    'mobile': (375, 667),      # Standard mobile (portrait)
-}
+# Chunks handed to each worker per pool round: enough to even out slow files
+# without paying one round trip per image
+CHUNKS_PER_WORKER = 4
+MAX_CHUNKSIZE = 64
+# Seconds between manifest saves during a batch, so an interrupted run keeps
+# most of its progress
+MANIFEST_SAVE_INTERVAL = 30
 
-def resize_image_smart(image, target_size, maintain_aspect=True):
+# Set in every pool worker by _init_worker
+_worker_output_dir = None
+_worker_plan = None
+_worker_hash_sources = False
+
+def convert_file(input_path, output_dir, plan):
     """
-    Resize image intelligently based on target size
+    Convert one image to every variant of the plan
+
+    Args:
+        input_path: Path to input image
+        output_dir: Directory the variants are written to
+        plan: Compiled variant plan
+
+    Returns:
+        Paths of the written variants; errors are raised
     """
-    if maintain_aspect:
-        # Calculate the ratio to fit the image within target dimensions
-        img_ratio = image.width / image.height
-        target_ratio = target_size[0] / target_size[1]
-        
-        if img_ratio > target_ratio:
-            # Image is wider than target ratio
-            new_width = target_size[0]
-            new_height = int(target_size[0] / img_ratio)
-        else:
-            # Image is taller than target ratio
-            new_height = target_size[1]
-            new_width = int(target_size[1] * img_ratio)
-            
-        resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Create a new image with target size and paste resized image centered
-        final_image = Image.new('RGB', target_size, (255, 255, 255))
-        paste_x = (target_size[0] - new_width) // 2
-        paste_y = (target_size[1] - new_height) // 2
-        final_image.paste(resized, (paste_x, paste_y))
-        
-        return final_image
-    else:
-        # Stretch to fit exactly
-        return image.resize(target_size, Image.Resampling.LANCZOS)
+    input_path = Path(input_path)
+    output_dir = Path(output_dir)
+    engine = ImageEngine(plan, LocalSink(output_dir))
+    keys = engine.keys_for(input_path.stem)
+    engine.convert(input_path, keys)
+    return [output_dir / keys[variant.id] for variant in plan.variants]
 
-def convert_image_to_devices(input_path, output_dir):
+def convert_image_to_devices(input_path, output_dir, plan=None):
     """
-    Convert an image to different device viewport sizes
-    
+    Convert an image to every variant of the plan
+
     Args:
         input_path: Path to input image
         output_dir: Output directory
-        quality: JPEG quality (1-100)
+        plan: Compiled variant plan (defaults to the "local" plan)
     """
-    input_path = Path(input_path)
-    output_dir = Path(output_dir)
-    output_dir.mkdir(exist_ok=True)
-    
-    # Load image
+    plan = plan or load_plan('local')
+
     try:
-        with Image.open(input_path) as img:
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            print(f"Processing image: {input_path.name}")
-            print(f"Original size: {img.width}x{img.height}")
-            
-            # Process each device
-            for device, target_size in DEVICE_VIEWPORTS.items():
-                print(f"\nConverting for {device}: {target_size[0]}x{target_size[1]}")
-                
-                # Apply conversion method (always using smart resize)
-                converted_img = resize_image_smart(img, target_size, maintain_aspect=True)
-                
-                # Save image
-                output_filename = f"{input_path.stem}_{device}.jpg"
-                output_path = output_dir / output_filename
-                
-                converted_img.save(
-                    output_path, 
-                    'JPEG', 
-                    quality=100, 
-                    optimize=True
-                )
-                
-                print(f"Saved: {output_path}")
-    
+        print(f"Processing image: {Path(input_path).name}")
+        for output_path in convert_file(input_path, output_dir, plan):
+            print(f"Saved: {output_path}")
     except Exception as e:
         print(f"Error processing image: {e}")
         return False
-    
+
     return True
 
-# Hardcoded paths - change these to your needs
-input_image = "photo.jpg" # Path to your input image
-output_directory = "images" # Output directory
+def find_images(root, extensions):
+    """Yield every file under root whose extension Pillow can read, in sorted order"""
+    with os.scandir(root) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from find_images(entry.path, extensions)
+        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in extensions:
+            yield Path(entry.path)
+
+def read_manifest(manifest):
+    """Image paths listed one per line in manifest ("-" for stdin); blank lines and # comments are skipped"""
+    lines = sys.stdin if manifest == '-' else Path(manifest).read_text().splitlines()
+    base = Path.cwd() if manifest == '-' else Path(manifest).parent
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield base / line
+
+def collect_tasks(inputs, manifest, plan):
+    """(image path, output subdirectory) for every input
+
+    Images found in a directory keep their place in its tree under the output
+    directory, so equal names in different folders do not overwrite each other.
+    Manifest entries do the same relative to the manifest's folder.
+    """
+    extensions = {
+        extension for extension, format in Image.registered_extensions().items()
+        if plan.input_formats is None or format in plan.input_formats
+    }
+    tasks = []
+    for item in inputs:
+        item = Path(item)
+        if item.is_dir():
+            tasks.extend((path, path.parent.relative_to(item)) for path in find_images(item, extensions))
+        else:
+            tasks.append((item, Path()))
+    if manifest:
+        base = Path.cwd() if manifest == '-' else Path(manifest).parent
+        for path in read_manifest(manifest):
+            subdir = path.parent.relative_to(base) if path.is_relative_to(base) else Path()
+            tasks.append((path, subdir))
+    return tasks
+
+def _init_worker(output_dir, plan, hash_sources=False):
+    global _worker_output_dir, _worker_plan, _worker_hash_sources
+    _worker_output_dir = Path(output_dir)
+    _worker_plan = plan
+    _worker_hash_sources = hash_sources
+
+def _convert_task(task):
+    """
+    Convert one task in a worker; a failure is returned, not raised, so the batch goes on
+
+    Returns:
+        (path, written paths or None when the content hash matched known_hash, hash, stat, error)
+    """
+    input_path, subdir, known_hash = task
+    try:
+        content_hash = stat = None
+        if _worker_hash_sources:
+            # Stat before reading, so a change during the conversion shows on the next run;
+            # hashed here rather than in the parent so hashing runs on every core
+            stat = os.stat(input_path)
+            content_hash = file_sha256(input_path)
+        if content_hash is not None and content_hash == known_hash:
+            return input_path, None, content_hash, stat, None
+        written = convert_file(input_path, _worker_output_dir / subdir, _worker_plan)
+        return input_path, written, content_hash, stat, None
+    except Exception as e:
+        return input_path, [], None, None, f"{type(e).__name__}: {e}"
+
+def _dirty_tasks(tasks, manifest, full=False):
+    """Tasks whose source changed since the manifest last saw it (all of them if full)"""
+    pending = []
+    for input_path, subdir in tasks:
+        try:
+            stat = os.stat(input_path)
+        except OSError:
+            # Left for the worker to report
+            pending.append((input_path, subdir, None))
+            continue
+        if full:
+            pending.append((input_path, subdir, None))
+        elif not manifest.is_current(input_path, stat):
+            pending.append((input_path, subdir, manifest.known_hash(input_path)))
+    return pending
+
+def convert_batch(tasks, output_dir, plan, workers=None, chunksize=None, manifest=None, full=False, executor='process'):
+    """
+    Convert every task across a pool of workers, reporting progress in input order
+
+    Args:
+        tasks: (image path, output subdirectory) pairs from collect_tasks
+        output_dir: Output directory
+        plan: Compiled variant plan
+        workers: Processes to use (defaults to every core)
+        chunksize: Tasks sent to a worker at a time (defaults to a few chunks per worker)
+        manifest: ConversionManifest of output_dir; when given, only sources that
+            changed are converted, and outputs of vanished sources are removed
+        full: Convert every task even if the manifest has it as up to date
+        executor: "process" (default), "thread" or "serial", see imaging.engine.make_executor
+
+    Returns:
+        The (path, error) pairs of the images that failed
+    """
+    started = time.perf_counter()
+    total = len(tasks)
+    if manifest is None:
+        tasks = [(input_path, subdir, None) for input_path, subdir in tasks]
+    else:
+        sources, files = manifest.remove_vanished()
+        if sources:
+            print(f"Removed {files} outputs of {sources} sources that no longer exist")
+        tasks = _dirty_tasks(tasks, manifest, full)
+        if total > len(tasks):
+            print(f"{total - len(tasks)} of {total} images are up to date")
+    if not tasks:
+        if manifest is not None:
+            manifest.save()
+        return []
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    if chunksize is None:
+        chunksize = max(1, min(MAX_CHUNKSIZE, math.ceil(len(tasks) / (workers * CHUNKS_PER_WORKER))))
+
+    failures = []
+    variants = 0
+    unchanged = 0
+    hash_sources = manifest is not None
+    if workers == 1 or executor == 'serial':
+        # Not worth the process start-up for one core or one image
+        executor, workers = 'serial', 1
+    pool = make_executor(executor, workers, _init_worker, (output_dir, plan, hash_sources))
+    # Process pools send tasks in chunks but results still come back in task order
+    results = pool.map(_convert_task, tasks, chunksize=chunksize)
+    last_saved = time.perf_counter()
+    try:
+        for done, (input_path, written, content_hash, stat, error) in enumerate(results, 1):
+            if error is not None:
+                failures.append((input_path, error))
+                print(f"[{done}/{len(tasks)}] {input_path}: failed, {error}")
+                continue
+            if written is None:
+                # Touched but not changed
+                manifest.touch(input_path, stat)
+                unchanged += 1
+                print(f"[{done}/{len(tasks)}] {input_path}: unchanged")
+                continue
+            variants += len(written)
+            print(f"[{done}/{len(tasks)}] {input_path}: {len(written)} variants")
+            if manifest is not None:
+                # Variants the plan no longer has
+                for stale in manifest.record(input_path, stat, content_hash, written):
+                    stale.unlink(missing_ok=True)
+                if time.perf_counter() - last_saved > MANIFEST_SAVE_INTERVAL:
+                    manifest.save()
+                    last_saved = time.perf_counter()
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if manifest is not None:
+            manifest.save()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"\nConverted {len(tasks) - len(failures) - unchanged} of {len(tasks)} images ({variants} variants"
+        f"{f', {unchanged} unchanged' if unchanged else ''}) "
+        f"in {elapsed:.1f}s with {workers} {executor} workers, {len(tasks) / max(elapsed, 1e-9):.1f} images/s"
+    )
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert images, or whole directory trees of them, to every variant of the local plan"
+    )
+    parser.add_argument('inputs', nargs='*', help="image files or directories (default: photo.jpg unless --manifest is given)")
+    parser.add_argument('-o', '--output', default='images', help="output directory (default: images)")
+    parser.add_argument('--manifest', help="file listing image paths one per line, or - for stdin")
+    parser.add_argument('-j', '--workers', type=int, help="worker processes (default: every core)")
+    parser.add_argument('--chunksize', type=int, help="images sent to a worker at a time")
+    parser.add_argument('--executor', choices=EXECUTOR_KINDS, default='process', help="how images are spread over the workers (default: process)")
+    parser.add_argument('--full', action='store_true', help="convert every image even if the output manifest says it is up to date")
+    args = parser.parse_args(argv)
 
-# Convert the image
-convert_image_to_devices(input_image, output_directory)
+    plan = load_plan('local')
+    inputs = args.inputs or ([] if args.manifest else ['photo.jpg'])
+    tasks = collect_tasks(inputs, args.manifest, plan)
+    if not tasks:
+        print("No images to convert")
+    # The manifest in the output directory lets reruns convert only what changed
+    manifest = ConversionManifest(args.output, plan.fingerprint)
+    failures = convert_batch(
+        tasks, args.output, plan, args.workers, args.chunksize, manifest, args.full, args.executor
+    )
+    for input_path, error in failures:
+        print(f"Failed: {input_path}: {error}", file=sys.stderr)
+    return 1 if failures else 0
 
-print("\nConversion completed!")
\ No newline at end of file
+if __name__ == '__main__':
+    sys.exit(main())
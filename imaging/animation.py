@@ -0,0 +1,285 @@
+import math
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+from imaging.plan import Variant, VariantPlan
+from imaging.resize import (
+    DECODE_MEMORY_LIMIT,
+    check_source_pixels,
+    decoded_bytes,
+    finish_variant,
+    node_size,
+)
+
+# Formats whose variants are written as animations from animated sources;
+# variants in any other format get the first frame, like a still
+ANIMATED_FORMATS = ("WEBP",)
+# Browsers play GIF delays of 10 ms or less at 100 ms
+MIN_FRAME_DURATION = 10
+DEFAULT_FRAME_DURATION = 100
+# Source pixels sampled either side of a resized region by LANCZOS, in units
+# of the downscale factor, plus a little slack for rounding
+LANCZOS_SUPPORT = 3
+REGION_SLACK = 2
+# Byte budgets are met by halving the frame rate down to MIN_FPS, then by
+# lowering quality in QUALITY_STEP steps down to the variant's min_quality
+MIN_FPS = 5
+QUALITY_STEP = 10
+
+
+def configure_gif_loading() -> None:
+    """Keep GIF frames in P mode while they share a palette
+
+    Frame differences are then taken on palette indices and only changed
+    regions are converted to RGB. This sets Pillow's process-wide GIF loading
+    strategy, so entry points that render animations call it once; without
+    it every frame after the first is decoded to RGB, which is slower but
+    renders the same.
+    """
+    from PIL import GifImagePlugin
+
+    GifImagePlugin.LOADING_STRATEGY = (
+        GifImagePlugin.LoadingStrategy.RGB_AFTER_DIFFERENT_PALETTE_ONLY
+    )
+
+
+class _Sampler:
+    """Samples frames down to max_fps; dropped frames lengthen the kept ones"""
+
+    def __init__(self, max_fps: float):
+        self.interval = 1000 / max_fps
+        self.durations: List[int] = []
+        self._elapsed = 0
+        self._last_kept = None
+
+    def offer(self, duration: int) -> bool:
+        """Account for a frame of duration ms; True if it should be kept"""
+        keep = (
+            self._last_kept is None or self._elapsed - self._last_kept >= self.interval
+        )
+        if keep:
+            self.durations.append(duration)
+            self._last_kept = self._elapsed
+        else:
+            self.durations[-1] += duration
+        self._elapsed += duration
+        return keep
+
+    def merge_last(self) -> None:
+        """Fold the last kept frame into the one before it (they are identical)"""
+        self.durations[-2] += self.durations.pop()
+
+    def halve(self) -> None:
+        """Keep every other frame from here on, and fold existing pairs"""
+        self.interval *= 2
+        self.durations = _fold_pairs(self.durations)
+
+
+def _fold_pairs(durations: List[int]) -> List[int]:
+    return [sum(durations[i : i + 2]) for i in range(0, len(durations), 2)]
+
+
+@dataclass
+class Animation:
+    """Rendered frames of one variant and how long each is shown (ms)"""
+
+    frames: List[Image.Image]
+    durations: List[int]
+    loop: int = 0
+
+    def resampled(self, max_fps: float) -> "Animation":
+        sampler = _Sampler(max_fps)
+        frames = [
+            frame
+            for frame, duration in zip(self.frames, self.durations)
+            if sampler.offer(duration)
+        ]
+        return Animation(frames, sampler.durations, self.loop)
+
+    def close(self) -> None:
+        for frame in self.frames:
+            frame.close()
+
+
+def is_animated(img: Image.Image) -> bool:
+    return getattr(img, "is_animated", False) and img.n_frames > 1
+
+
+def animated_variants(plan: VariantPlan) -> List[Variant]:
+    return [variant for variant in plan.variants if variant.format in ANIMATED_FORMATS]
+
+
+def _flatten(frame: Image.Image) -> Image.Image:
+    """frame as RGB, transparent areas on white like pad_to_canvas"""
+    if frame.mode == "RGB":
+        return frame
+    rgba = frame.convert("RGBA")
+    canvas = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+    canvas.alpha_composite(rgba)
+    return canvas.convert("RGB")
+
+
+def _changed_box(previous: Image.Image, frame: Image.Image) -> Optional[Tuple]:
+    if previous.mode != frame.mode:
+        return (0, 0) + frame.size
+    # Every band counts: by default RGBA boxes only look at alpha
+    return ImageChops.difference(previous, frame).getbbox(alpha_only=False)
+
+
+def _resize_region(
+    frame: Image.Image, box: Tuple[int, int, int, int], size: Tuple[int, int]
+) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Resize the part of frame around box to its place in a size-sized output
+
+    Only source pixels the LANCZOS filter reaches are cropped and flattened,
+    and resize(box=...) keeps the output pixel grid of a full-frame resize,
+    so the region pastes onto the previous output without seams.
+    """
+    scale_x, scale_y = size[0] / frame.width, size[1] / frame.height
+    # Source pixels either side that the filter reaches, which is also how far
+    # a change spreads in the output
+    reach_x = LANCZOS_SUPPORT / min(scale_x, 1) + REGION_SLACK
+    reach_y = LANCZOS_SUPPORT / min(scale_y, 1) + REGION_SLACK
+    out = (
+        max(0, math.floor((box[0] - reach_x) * scale_x)),
+        max(0, math.floor((box[1] - reach_y) * scale_y)),
+        min(size[0], math.ceil((box[2] + reach_x) * scale_x)),
+        min(size[1], math.ceil((box[3] + reach_y) * scale_y)),
+    )
+    margin_x, margin_y = math.ceil(reach_x), math.ceil(reach_y)
+    source = (
+        max(0, int(out[0] / scale_x) - margin_x),
+        max(0, int(out[1] / scale_y) - margin_y),
+        min(frame.width, math.ceil(out[2] / scale_x) + margin_x),
+        min(frame.height, math.ceil(out[3] / scale_y) + margin_y),
+    )
+    region = _flatten(frame.crop(source)).resize(
+        (out[2] - out[0], out[3] - out[1]),
+        Image.Resampling.LANCZOS,
+        box=(
+            out[0] / scale_x - source[0],
+            out[1] / scale_y - source[1],
+            out[2] / scale_x - source[0],
+            out[3] / scale_y - source[1],
+        ),
+    )
+    return region, out[:2]
+
+
+def render_animation(
+    img: Image.Image, plan: VariantPlan, memory_limit: Optional[int] = None
+) -> Dict[Tuple[str, str], Animation]:
+    """Render every animated-format variant of an animated source
+
+    Returns {} for stills and plans without animated formats. img is left on
+    its first frame, ready for decode_for_plan and the still variants.
+    Frames are sampled down to the highest max_fps among those variants.
+    Each kept frame is resized only where it differs from the previous kept
+    frame, on top of a copy of the previous output; frames with no change
+    just extend the previous one. If the rendered frames would outgrow
+    memory_limit (DECODE_MEMORY_LIMIT by default), the frame rate is halved
+    as often as needed rather than cutting the animation short.
+    """
+    if memory_limit is None:
+        memory_limit = DECODE_MEMORY_LIMIT
+    variants = animated_variants(plan)
+    if not variants or not is_animated(img):
+        return {}
+    check_source_pixels(img)
+    nodes = [
+        node
+        for node in plan.nodes
+        if any(variant in variants for variant in node.variants)
+    ]
+    sizes = [node_size(node, img.size) for node in nodes]
+    frame_budget = max(
+        2, memory_limit // sum(decoded_bytes(size, "RGB") for size in sizes)
+    )
+
+    sampler = _Sampler(max(variant.max_fps for variant in variants))
+    outputs: List[List[Image.Image]] = [[] for _ in nodes]
+    previous = None
+    for index in range(img.n_frames):
+        img.seek(index)
+        # WebP only reports a frame's duration once it is decoded
+        img.load()
+        duration = img.info.get("duration") or 0
+        if duration <= MIN_FRAME_DURATION:
+            duration = DEFAULT_FRAME_DURATION
+        if not sampler.offer(duration):
+            continue
+        box = None if previous is None else _changed_box(previous, img)
+        if previous is not None and box is None:
+            sampler.merge_last()
+            continue
+        for frames, size in zip(outputs, sizes):
+            if previous is None or box == (0, 0) + img.size:
+                frames.append(_flatten(img).resize(size, Image.Resampling.LANCZOS))
+                continue
+            region, position = _resize_region(img, box, size)
+            frame = frames[-1].copy()
+            frame.paste(region, position)
+            frames.append(frame)
+        previous = img.copy()
+        if len(sampler.durations) > frame_budget:
+            if len(sampler.durations) % 2 == 0:
+                # The frame just rendered goes, so previous no longer matches
+                # the last output: render the next kept frame in full
+                previous = None
+            sampler.halve()
+            outputs = [frames[::2] for frames in outputs]
+
+    loop = img.info.get("loop", 0)
+    img.seek(0)
+    animations = {}
+    for node, frames in zip(nodes, outputs):
+        # Each Animation is closed once its variant is encoded, so variants
+        # that finish_variant leaves unframed get frames of their own
+        handed_out = False
+        if node.fit == "cover":
+            left = (frames[0].width - node.width) // 2
+            top = (frames[0].height - node.height) // 2
+            frames = [
+                frame.crop((left, top, left + node.width, top + node.height))
+                for frame in frames
+            ]
+        for variant in node.variants:
+            if variant in variants:
+                finished = [finish_variant(variant, frame) for frame in frames]
+                if finished[0] is frames[0]:
+                    if handed_out:
+                        finished = [frame.copy() for frame in frames]
+                    handed_out = True
+                animations[variant.id] = Animation(
+                    finished, list(sampler.durations), loop
+                )
+    return animations
+
+
+def encode_animation(animation: Animation, variant: Variant) -> BytesIO:
+    """Encode an animated variant, meeting max_bytes by frame rate then quality"""
+    max_fps = variant.max_fps
+    quality = variant.quality
+    while True:
+        current = animation.resampled(max_fps)
+        buffer = BytesIO()
+        current.frames[0].save(
+            buffer,
+            save_all=True,
+            append_images=current.frames[1:],
+            duration=current.durations,
+            loop=current.loop,
+            **variant.save_kwargs(quality),
+        )
+        if variant.max_bytes is None or buffer.getbuffer().nbytes <= variant.max_bytes:
+            return buffer
+        if max_fps / 2 >= MIN_FPS and len(current.frames) > 1:
+            max_fps /= 2
+        elif quality - QUALITY_STEP >= variant.min_quality:
+            quality -= QUALITY_STEP
+        else:
+            # As small as this variant is allowed to get
+            return buffer
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import threading
+from io import BytesIO
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+# Entries are stored per plan fingerprint, so a plan change never reuses
+# variants rendered with the old settings
+INDEX_KEY_TEMPLATE = "{fingerprint}/{content_hash}"
+# Bytes read and hashed at a time while a source downloads
+READ_CHUNK = 1024 * 1024
+
+
+def read_hashed(body, size: int) -> Tuple[BytesIO, str]:
+    """Read a streaming body of size bytes into a BytesIO, hashing it (SHA-256)
+
+    The BytesIO is allocated at full size up front and each chunk is read
+    straight into it with readinto() and hashed there, so the source is
+    held once and hashed while it downloads.
+    """
+    source = BytesIO()
+    if size:
+        # Writing the last byte allocates the whole buffer in one go
+        source.seek(size - 1)
+        source.write(b"\0")
+    digest = hashlib.sha256()
+    with source.getbuffer() as view:
+        offset = 0
+        while offset < size:
+            read = body.readinto(view[offset : offset + READ_CHUNK])
+            if not read:
+                raise IOError(f"Body ended after {offset} of {size} bytes")
+            digest.update(view[offset : offset + read])
+            offset += read
+    source.seek(0)
+    return source, digest.hexdigest()
+
+
+def index_key(fingerprint: str, content_hash: str) -> str:
+    return INDEX_KEY_TEMPLATE.format(fingerprint=fingerprint, content_hash=content_hash)
+
+
+def variant_label(variant_id: Iterable[str]) -> str:
+    """JSON-friendly form of a variant id, e.g. "laptop.JPEG" """
+    return ".".join(variant_id)
+
+
+class MemoryDedupIndex:
+    """In-process index; the local stand-in for tests and benchmarks"""
+
+    def __init__(self):
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self.entries.get(key)
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.entries[key] = entry
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self.entries.pop(key, None)
+
+
+class S3DedupIndex:
+    """Index entries as small JSON objects next to the variants"""
+
+    def __init__(self, s3, bucket: str, prefix: str = ".dedup/"):
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.s3.get_object(
+                Bucket=self.bucket, Key=f"{self.prefix}{key}.json"
+            )
+        except ClientError:
+            # Missing entries read as NoSuchKey, or AccessDenied without
+            # s3:ListBucket; either way there is nothing to reuse
+            return None
+        return json.loads(response["Body"].read())
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{key}.json",
+            Body=json.dumps(entry).encode(),
+            ContentType="application/json",
+        )
+
+    def delete(self, key: str) -> None:
+        self.s3.delete_object(Bucket=self.bucket, Key=f"{self.prefix}{key}.json")
+
+
+class DynamoDedupIndex:
+    """Index entries as items of a DynamoDB table keyed by the string contentKey"""
+
+    def __init__(self, dynamodb, table: str):
+        self.dynamodb = dynamodb
+        self.table = table
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self.dynamodb.get_item(
+            TableName=self.table, Key={"contentKey": {"S": key}}
+        ).get("Item")
+        return None if item is None else json.loads(item["entry"]["S"])
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        self.dynamodb.put_item(
+            TableName=self.table,
+            Item={"contentKey": {"S": key}, "entry": {"S": json.dumps(entry)}},
+        )
+
+    def delete(self, key: str) -> None:
+        self.dynamodb.delete_item(TableName=self.table, Key={"contentKey": {"S": key}})
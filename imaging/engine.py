@@ -0,0 +1,254 @@
+import time
+from contextlib import nullcontext
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from imaging.animation import Animation, encode_animation, render_animation
+from imaging.plan import Variant, VariantPlan
+from imaging.quality import encode_variant
+from imaging.resize import (
+    MemoryBudget,
+    decode_for_plan,
+    finish_variant,
+    planned_decode_memory,
+    run_resize_dag,
+)
+
+EXECUTOR_KINDS = ("serial", "thread", "process")
+
+
+class SerialExecutor(Executor):
+    """Runs each task as it is submitted, on the calling thread"""
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        # Lazily, so results (and progress) come as each task finishes
+        return map(fn, *iterables)
+
+
+def make_executor(
+    kind: str,
+    workers: Optional[int] = None,
+    initializer: Optional[Callable] = None,
+    initargs: Tuple = (),
+) -> Executor:
+    """A serial, thread pool or process pool executor
+
+    Process pools pickle every task, so they suit whole files (paths in,
+    counts out) rather than decoded images or anything holding a client.
+    """
+    if kind == "serial":
+        if initializer is not None:
+            initializer(*initargs)
+        return SerialExecutor()
+    if kind == "thread":
+        return ThreadPoolExecutor(workers, initializer=initializer, initargs=initargs)
+    if kind == "process":
+        return ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs)
+    raise ValueError(f"Unknown executor {kind!r}; expected one of {EXECUTOR_KINDS}")
+
+
+def encode(image, variant: Variant) -> BytesIO:
+    """Encode a finished variant, still or animated"""
+    if isinstance(image, Animation):
+        return encode_animation(image, variant)
+    return encode_variant(image, variant)
+
+
+class LocalSink:
+    """Writes variants under a directory; keys are relative paths"""
+
+    metric = "writeMs"
+
+    def __init__(self, output_dir: Path):
+        self.output_dir = Path(output_dir)
+
+    def write(self, variant: Variant, key: str, buffer: BytesIO) -> None:
+        path = self.output_dir / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(buffer.getbuffer())
+
+
+class S3Sink:
+    """Uploads variants to a bucket with the given object metadata
+
+    The ETag of every object written is kept in etags, by key.
+    """
+
+    metric = "uploadMs"
+
+    def __init__(self, s3, bucket: str, metadata: Optional[Dict[str, str]] = None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.metadata = metadata or {}
+        self.etags: Dict[str, str] = {}
+
+    @classmethod
+    def from_manager(cls, manager, bucket: str, metadata=None) -> "S3Sink":
+        """Sink on the client of an initialized services.s3_service.S3Manager"""
+        return cls(manager.s3_client, bucket, metadata)
+
+    def write(self, variant: Variant, key: str, buffer: BytesIO) -> None:
+        # The buffer goes to botocore as-is: no getvalue() copy, and botocore
+        # computes the CRC32 trailer checksum while streaming
+        content_length = buffer.getbuffer().nbytes
+        buffer.seek(0)
+        response = self.s3.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=buffer,
+            ContentLength=content_length,
+            ContentType=variant.content_type,
+            Metadata=self.metadata,
+        )
+        self.etags[key] = response["ETag"]
+
+
+def encode_and_write(sink, image, variant: Variant, key: str, release: bool) -> Dict:
+    """Encode one variant and hand it to sink; runs on the engine's executor
+
+    Returns the variant's encodeMs, write time (named by the sink's metric)
+    and outputBytes.
+    """
+    started = time.perf_counter()
+    buffer = encode(image, variant)
+    encode_ms = (time.perf_counter() - started) * 1000
+    # The variant's own pixels are not needed while it is written
+    if release:
+        image.close()
+
+    started = time.perf_counter()
+    sink.write(variant, key, buffer)
+    return {
+        "encodeMs": encode_ms,
+        sink.metric: (time.perf_counter() - started) * 1000,
+        "outputBytes": buffer.getbuffer().nbytes,
+    }
+
+
+@dataclass
+class Conversion:
+    """Stage metrics of one source, and each variant's sample in plan node order"""
+
+    metrics: Dict[str, float] = field(default_factory=dict)
+    outputs: List[Tuple[Variant, Dict[str, Any]]] = field(default_factory=list)
+
+
+class ImageEngine:
+    """Converts sources to every variant of a plan, for the Lambda and local script
+
+    Each source is opened once, animated variants are rendered from its
+    frames, the rest is decoded at the smallest scale the plan allows and
+    resized through the plan's DAG on the calling thread. Encoding and
+    writing each variant go to the executor (serial by default), so with a
+    thread pool they overlap the next resize.
+
+    memory_limit is what one decode aims for. With a memory_budget shared by
+    concurrent conversions, each reserves its decode memory for as long as
+    it converts, and sources no decode can bound are refused only beyond the
+    whole budget.
+    """
+
+    def __init__(
+        self,
+        plan: VariantPlan,
+        sink,
+        executor: Optional[Executor] = None,
+        memory_limit: Optional[int] = None,
+        memory_budget: Optional[MemoryBudget] = None,
+    ):
+        self.plan = plan
+        self.sink = sink
+        self.executor = executor or SerialExecutor()
+        self.memory_limit = memory_limit
+        self.memory_budget = memory_budget
+
+    def _reserve(self, img: Image.Image):
+        if self.memory_budget is None:
+            return nullcontext()
+        needed = planned_decode_memory(img, self.plan, self.memory_limit)
+        if needed > self.memory_budget.total:
+            # decode_for_plan refuses it without allocating anything
+            return nullcontext()
+        return self.memory_budget.reserve(needed)
+
+    def keys_for(self, stem: str, prefix: Optional[str] = None) -> Dict:
+        if prefix is None:
+            prefix = self.plan.dest_prefix
+        return {
+            variant.id: variant.key_for(stem, prefix) for variant in self.plan.variants
+        }
+
+    def convert(self, source, keys: Dict) -> Conversion:
+        """Convert source (a path or file object) to keys from keys_for
+
+        A file object is closed once decoded, since only the pixels are
+        needed after that. The first error from any variant is raised once
+        every variant has finished.
+        """
+        conversion = Conversion()
+        started = time.perf_counter()
+        max_memory = self.memory_budget.total if self.memory_budget else None
+        img = Image.open(source, formats=self.plan.input_formats)
+        with img, self._reserve(img):
+            original_size = img.size
+            animations = render_animation(img, self.plan, self.memory_limit)
+            # Checks the header against MAX_SOURCE_PIXELS and decodes within
+            # memory_limit, reducing huge sources as they are read
+            base = decode_for_plan(img, self.plan, self.memory_limit, max_memory)
+            conversion.metrics["decodeMs"] = (time.perf_counter() - started) * 1000
+            conversion.metrics["sourceMegapixels"] = (
+                original_size[0] * original_size[1] / 1e6
+            )
+            if not isinstance(source, (str, Path)):
+                source.close()
+
+            submitted, futures = [], []
+            started = time.perf_counter()
+            try:
+                # Animated variants are already rendered; their nodes are only
+                # resized when a later node resizes from them
+                for node, resized in run_resize_dag(
+                    base, original_size, self.plan, animations
+                ):
+                    for variant in node.variants:
+                        converted_img = animations.get(variant.id) or finish_variant(
+                            variant, resized
+                        )
+                        futures.append(
+                            self.executor.submit(
+                                encode_and_write,
+                                self.sink,
+                                converted_img,
+                                variant,
+                                keys[variant.id],
+                                converted_img is not resized,
+                            )
+                        )
+                        submitted.append(variant)
+                # Includes framing; encodes overlap on the executor and are timed there
+                conversion.metrics["resizeMs"] = (time.perf_counter() - started) * 1000
+            finally:
+                wait(futures)
+        conversion.outputs = [
+            (variant, future.result()) for variant, future in zip(submitted, futures)
+        ]
+        return conversion
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+MB = 1024 * 1024
+MANIFEST_NAME = ".conversion-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: Path, chunk_size: int = MB) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_key(path: Path) -> str:
+    return os.path.abspath(path)
+
+
+class ConversionManifest:
+    """What was converted into an output directory, and from what
+
+    Each source is recorded by absolute path with its size, mtime, SHA-256
+    and the outputs written for it (relative to the output directory), under
+    the fingerprint of the plan that produced them. A source is current when
+    the plan is the same, its size and mtime match and its outputs still
+    exist, which takes a stat per file rather than a read. A source whose
+    stat changed but whose hash did not only needs its stat refreshed.
+    """
+
+    def __init__(self, output_dir: Path, fingerprint: str):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_NAME
+        self.fingerprint = fingerprint
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text())
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data["entries"]
+
+    def _entry(self, path: Path) -> Optional[Dict[str, Any]]:
+        return self.entries.get(source_key(path))
+
+    def is_current(self, path: Path, stat: os.stat_result) -> bool:
+        entry = self._entry(path)
+        return (
+            entry is not None
+            and entry["fingerprint"] == self.fingerprint
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and all((self.output_dir / output).exists() for output in entry["outputs"])
+        )
+
+    def known_hash(self, path: Path) -> Optional[str]:
+        """Hash of path's last conversion with this plan, if its outputs are all there"""
+        entry = self._entry(path)
+        if entry is None or entry["fingerprint"] != self.fingerprint:
+            return None
+        if not all((self.output_dir / output).exists() for output in entry["outputs"]):
+            return None
+        return entry["sha256"]
+
+    def touch(self, path: Path, stat: os.stat_result) -> None:
+        """Same content under a new stat: remember it so the next run skips the hash"""
+        entry = self._entry(path)
+        entry["size"], entry["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+
+    def record(
+        self, path: Path, stat: os.stat_result, sha256: str, outputs: List[Path]
+    ) -> List[Path]:
+        """Record a conversion; returns earlier outputs this one no longer writes"""
+        relative = [
+            Path(output).relative_to(self.output_dir).as_posix() for output in outputs
+        ]
+        previous = self._entry(path)
+        self.entries[source_key(path)] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256,
+            "fingerprint": self.fingerprint,
+            "outputs": relative,
+        }
+        if previous is None:
+            return []
+        return [
+            self.output_dir / output
+            for output in previous["outputs"]
+            if output not in relative
+        ]
+
+    def remove_vanished(self) -> Tuple[int, int]:
+        """Delete the outputs of sources that no longer exist; returns (sources, files)"""
+        vanished = [key for key in self.entries if not os.path.exists(key)]
+        files = 0
+        for key in vanished:
+            for output in self.entries.pop(key)["outputs"]:
+                output_path = self.output_dir / output
+                if output_path.exists():
+                    output_path.unlink()
+                    files += 1
+        return len(vanished), files
+
+    def save(self) -> None:
+        # Written aside and renamed, so an interrupted run keeps the old manifest
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        temporary = self.path.with_name(self.path.name + ".tmp")
+        temporary.write_text(
+            json.dumps({"version": MANIFEST_VERSION, "entries": self.entries})
+        )
+        os.replace(temporary, self.path)
@@ -0,0 +1,57 @@
+import json
+import time
+from typing import Dict, Iterable, Mapping, Optional
+
+# CloudWatch unit for each metric name suffix; anything else is a plain count
+UNIT_SUFFIXES = (("Ms", "Milliseconds"), ("Bytes", "Bytes"), ("Mb", "Megabytes"))
+
+
+def metric_unit(name: str) -> str:
+    for suffix, unit in UNIT_SUFFIXES:
+        if name.endswith(suffix):
+            return unit
+    return "Count"
+
+
+def sum_metrics(samples: Iterable[Mapping[str, float]]) -> Dict[str, float]:
+    """Add up metrics by name across samples"""
+    totals: Dict[str, float] = {}
+    for sample in samples:
+        for name, value in sample.items():
+            totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def emf_line(
+    namespace: str,
+    metrics: Mapping[str, float],
+    dimensions: Optional[Mapping[str, str]] = None,
+    properties: Optional[Mapping[str, object]] = None,
+) -> str:
+    """One CloudWatch embedded metric format log line
+
+    CloudWatch Logs turns the line into metrics under namespace on its own,
+    so publishing them takes no API calls. properties are kept in the log
+    line for Logs Insights without becoming metrics.
+    """
+    dimensions = dict(dimensions or {})
+    return json.dumps(
+        {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": namespace,
+                        "Dimensions": [list(dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": metric_unit(name)}
+                            for name in metrics
+                        ],
+                    }
+                ],
+            },
+            **dict(properties or {}),
+            **dimensions,
+            **{name: round(value, 2) for name, value in metrics.items()},
+        }
+    )
@@ -0,0 +1,258 @@
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import features
+
+from imaging.plugins import FORMAT_PLUGINS
+from imaging.presets import ENCODER_PRESETS, preset_save_kwargs
+
+PLANS_DIR = Path(__file__).parent / "plans"
+
+# "pad" and "contain" both fit inside the box and share one resize; "pad" then
+# centers the result on a white canvas of the exact box size
+FIT_MODES = ("pad", "contain", "cover", "stretch")
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "AVIF": "avif"}
+CONTENT_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "AVIF": "image/avif",
+}
+# Pillow feature names of the encoders behind each format
+FORMAT_CODECS = {"JPEG": "jpg", "PNG": "zlib", "WEBP": "webp", "AVIF": "avif"}
+DEFAULT_KEY_TEMPLATE = "{prefix}{stem}_{name}.{ext}"
+# Formats whose quality setting can be searched to meet max_bytes/min_psnr
+SEARCHABLE_FORMATS = ("JPEG", "WEBP", "AVIF")
+
+
+@dataclass(frozen=True)
+class Variant:
+    """One output rendition: box size, fit mode, encoding and destination key"""
+
+    name: str
+    width: int
+    height: int
+    fit: str = "pad"
+    format: str = "JPEG"
+    quality: int = 85
+    options: Dict[str, Any] = field(default_factory=dict)
+    key_template: str = DEFAULT_KEY_TEMPLATE
+    # Optional variants are dropped when this Pillow build lacks their encoder
+    optional: bool = False
+    # Encoding targets met by searching quality between min_quality and quality
+    max_bytes: Optional[int] = None
+    min_psnr: Optional[float] = None
+    min_quality: int = 40
+    # Named encoder settings from ENCODER_PRESETS; options override them
+    preset: Optional[str] = None
+    # Frame rate cap for variants rendered as animations
+    max_fps: float = 15
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    @property
+    def id(self) -> Tuple[str, str]:
+        """Variants are identified by name and format, e.g. ("laptop", "WEBP")"""
+        return self.name, self.format
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[self.format]
+
+    def key_for(self, stem: str, prefix: str = "") -> str:
+        """Render the destination key for a source with the given stem"""
+        return self.key_template.format(
+            prefix=prefix,
+            stem=stem,
+            name=self.name,
+            width=self.width,
+            height=self.height,
+            ext=FORMAT_EXTENSIONS[self.format],
+        )
+
+    @property
+    def has_target(self) -> bool:
+        return self.max_bytes is not None or self.min_psnr is not None
+
+    def save_kwargs(self, quality: Optional[int] = None) -> Dict[str, Any]:
+        """Keyword arguments for Image.save(), optionally at another quality"""
+        quality = self.quality if quality is None else quality
+        if self.preset is not None:
+            return {
+                "format": self.format,
+                **preset_save_kwargs(self.format, self.preset, quality, self.options),
+            }
+        return {"format": self.format, "quality": quality, **self.options}
+
+
+@dataclass(frozen=True)
+class ResizeNode:
+    """One shared resize in the execution DAG
+
+    ``parent`` is the index of the node this one is resized from, or None
+    for the decoded source. Every variant listed is finished from the
+    node's output, so variants that differ only in encoding share it.
+    """
+
+    width: int
+    height: int
+    fit: str
+    parent: Optional[int]
+    variants: Tuple[Variant, ...]
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+
+@dataclass(frozen=True)
+class VariantPlan:
+    """A compiled plan: variants plus the resize DAG that produces them"""
+
+    variants: Tuple[Variant, ...]
+    nodes: Tuple[ResizeNode, ...]
+    dest_bucket: Optional[str]
+    dest_prefix: str
+    fingerprint: str
+    # Source formats to accept, or None for anything Pillow can open
+    input_formats: Optional[Tuple[str, ...]] = None
+
+    @property
+    def formats(self) -> Optional[Tuple[str, ...]]:
+        """Every format the plan reads or writes, or None if inputs are open-ended"""
+        if self.input_formats is None:
+            return None
+        return tuple(
+            sorted(
+                set(self.input_formats) | {variant.format for variant in self.variants}
+            )
+        )
+
+
+def _resize_kind(fit: str) -> str:
+    return "contain" if fit == "pad" else fit
+
+
+def _parse_variant(config: Dict[str, Any]) -> Variant:
+    try:
+        variant = Variant(
+            name=config["name"],
+            width=int(config["width"]),
+            height=int(config["height"]),
+            fit=config.get("fit", "pad"),
+            format=config.get("format", "JPEG").upper(),
+            quality=int(config.get("quality", 85)),
+            options=dict(config.get("options", {})),
+            key_template=config.get("key_template", DEFAULT_KEY_TEMPLATE),
+            optional=bool(config.get("optional", False)),
+            max_bytes=int(config["max_bytes"]) if "max_bytes" in config else None,
+            min_psnr=float(config["min_psnr"]) if "min_psnr" in config else None,
+            min_quality=int(config.get("min_quality", 40)),
+            preset=config.get("preset"),
+            max_fps=float(config.get("max_fps", 15)),
+        )
+    except KeyError as e:
+        raise ValueError(f"Variant is missing required field {e}") from e
+
+    if variant.width <= 0 or variant.height <= 0:
+        raise ValueError(f"Variant {variant.name!r} needs a positive width and height")
+    if variant.max_fps <= 0:
+        raise ValueError(f"Variant {variant.name!r} needs a positive max_fps")
+    if variant.fit not in FIT_MODES:
+        raise ValueError(f"Variant {variant.name!r} has unknown fit {variant.fit!r}")
+    if variant.format not in FORMAT_EXTENSIONS:
+        raise ValueError(
+            f"Variant {variant.name!r} has unknown format {variant.format!r}"
+        )
+    if variant.preset is not None and variant.preset not in ENCODER_PRESETS.get(
+        variant.format, {}
+    ):
+        raise ValueError(
+            f"Variant {variant.name!r} has unknown {variant.format} preset {variant.preset!r}"
+        )
+    if variant.has_target and variant.format not in SEARCHABLE_FORMATS:
+        raise ValueError(
+            f"Variant {variant.name!r} sets max_bytes or min_psnr, but {variant.format} "
+            f"has no quality to search; use one of {', '.join(SEARCHABLE_FORMATS)}"
+        )
+    return variant
+
+
+def compile_plan(config: Dict[str, Any]) -> VariantPlan:
+    """Validate a plan config and compile it into a resize DAG
+
+    Variants needing the same resize share one node. Nodes run largest
+    first and each aspect-preserving node feeds the next smaller ones, so
+    adding a size costs one small resize rather than one from the source.
+    """
+    variants = []
+    for variant in map(_parse_variant, config.get("variants", [])):
+        if not features.check(FORMAT_CODECS[variant.format]):
+            if variant.optional:
+                continue
+            raise ValueError(
+                f"Variant {variant.name!r} needs {variant.format} support, which this Pillow build lacks"
+            )
+        variants.append(variant)
+    variants = tuple(variants)
+    if not variants:
+        raise ValueError("Variant plan has no variants")
+    ids = [variant.id for variant in variants]
+    if len(set(ids)) != len(ids):
+        raise ValueError("Variant name and format pairs must be unique")
+
+    input_formats = config.get("input_formats")
+    if input_formats is not None:
+        input_formats = tuple(format_name.upper() for format_name in input_formats)
+        unknown = sorted(set(input_formats) - set(FORMAT_PLUGINS))
+        if unknown:
+            raise ValueError(f"Unknown input formats: {', '.join(unknown)}")
+
+    groups: Dict[Tuple[int, int, str], List[Variant]] = {}
+    for variant in variants:
+        groups.setdefault(
+            (variant.width, variant.height, _resize_kind(variant.fit)), []
+        ).append(variant)
+    ordered = sorted(
+        groups.items(), key=lambda item: item[0][0] * item[0][1], reverse=True
+    )
+
+    nodes = []
+    for (width, height, fit), members in ordered:
+        # Only "contain" outputs keep the source aspect ratio intact, so only
+        # they can feed a smaller resize; the runtime still falls back to
+        # the source when a parent turns out too small for this image
+        parent = next(
+            (i for i in range(len(nodes) - 1, -1, -1) if nodes[i].fit == "contain"),
+            None,
+        )
+        nodes.append(ResizeNode(width, height, fit, parent, tuple(members)))
+
+    fingerprint = hashlib.sha256(
+        json.dumps([asdict(variant) for variant in variants], sort_keys=True).encode()
+    ).hexdigest()[:16]
+    return VariantPlan(
+        variants=variants,
+        nodes=tuple(nodes),
+        dest_bucket=config.get("dest_bucket"),
+        dest_prefix=config.get("dest_prefix", ""),
+        fingerprint=fingerprint,
+        input_formats=input_formats,
+    )
+
+
+def load_plan(default_name: str) -> VariantPlan:
+    """Load and compile the plan from $VARIANT_PLAN, $VARIANT_PLAN_FILE or plans/<default_name>.json"""
+    if os.environ.get("VARIANT_PLAN"):
+        config = json.loads(os.environ["VARIANT_PLAN"])
+    else:
+        path = os.environ.get("VARIANT_PLAN_FILE") or PLANS_DIR / f"{default_name}.json"
+        with open(path) as plan_file:
+            config = json.load(plan_file)
+    return compile_plan(config)
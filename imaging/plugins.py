@@ -0,0 +1,34 @@
+import importlib
+from typing import Iterable
+
+# Pillow plugin module that reads and writes each format
+FORMAT_PLUGINS = {
+    "AVIF": "AvifImagePlugin",
+    "BMP": "BmpImagePlugin",
+    "GIF": "GifImagePlugin",
+    "JPEG": "JpegImagePlugin",
+    "PNG": "PngImagePlugin",
+    "PPM": "PpmImagePlugin",
+    "TIFF": "TiffImagePlugin",
+    "WEBP": "WebPImagePlugin",
+}
+
+
+def register_formats(formats: Iterable[str]) -> None:
+    """Register only the plugins for formats, by importing their modules
+
+    Image.open() and Image.save() fall back to Image.init(), which imports
+    every plugin Pillow ships, only when asked for a format that is not
+    registered. Saving to these formats and opening with formats= limited
+    to them (as ImageEngine does with the plan's input_formats) then never
+    loads the rest, beyond the small preinit set (BMP, GIF, JPEG, PPM, PNG)
+    every open and save imports; a source in any other format fails to open
+    with UnidentifiedImageError.
+    """
+    for format_name in formats:
+        try:
+            importlib.import_module(f"PIL.{FORMAT_PLUGINS[format_name]}")
+        except ImportError:
+            # Plugin missing from this Pillow build; compile_plan has already
+            # dropped or refused variants that need it
+            pass
@@ -0,0 +1,78 @@
+from typing import Any, Dict, List
+
+from PIL.JpegPresets import presets as JPEG_PRESETS
+
+# Encoder settings behind each named preset, per format. JPEG presets take
+# their quantization tables (by JpegPresets name) and chroma subsampling from
+# Pillow's bundled JpegPresets, tuned tables that beat libjpeg's defaults on
+# bytes at equal quality; the variant's quality still scales them
+ENCODER_PRESETS: Dict[str, Dict[str, Dict[str, Any]]] = {
+    "JPEG": {
+        "fast": {"subsampling": "4:2:0"},
+        "balanced": {"subsampling": "4:2:0", "optimize": True, "qtables": "web_medium"},
+        "smallest": {
+            "subsampling": "4:2:0",
+            "optimize": True,
+            "progressive": True,
+            "qtables": "web_low",
+        },
+    },
+    "WEBP": {
+        "fast": {"method": 0},
+        "balanced": {"method": 4},
+        "smallest": {"method": 6},
+    },
+    "AVIF": {
+        "fast": {"speed": 10},
+        "balanced": {"speed": 6},
+        "smallest": {"speed": 2},
+    },
+    "PNG": {
+        "fast": {"compress_level": 1},
+        "balanced": {"compress_level": 6},
+        "smallest": {"optimize": True},
+    },
+}
+
+# Mean of libjpeg's standard (ITU T.81 Annex K) luminance and chrominance
+# tables, which libjpeg scales by quality from 50
+STANDARD_TABLE_MEANS = (57.625, 86.015625)
+
+
+def quality_scaling(quality: int) -> int:
+    """libjpeg's jpeg_quality_scaling(): table scale in percent for quality"""
+    quality = min(max(quality, 1), 100)
+    return 5000 // quality if quality < 50 else 200 - quality * 2
+
+
+def scaled_qtables(preset_name: str, quality: int) -> List[List[int]]:
+    """JpegPresets tables rescaled so quality means what it does for libjpeg
+
+    Pillow applies custom tables as-is (quality then acts as a raw scale
+    factor, smaller files for higher values), which would break the quality
+    search. Each table is normalised to the mean of libjpeg's standard table
+    and scaled like it, so only the shape of the preset's tables changes.
+    """
+    scale = quality_scaling(quality)
+    tables = []
+    for table, standard_mean in zip(
+        JPEG_PRESETS[preset_name]["quantization"], STANDARD_TABLE_MEANS
+    ):
+        norm = standard_mean * 64 / sum(table)
+        tables.append(
+            [
+                min(255, max(1, int((value * norm * scale + 50) // 100)))
+                for value in table
+            ]
+        )
+    return tables
+
+
+def preset_save_kwargs(
+    format_name: str, preset: str, quality: int, options: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Image.save() arguments for preset at quality, with options on top"""
+    kwargs = {"quality": quality, **ENCODER_PRESETS[format_name][preset], **options}
+    if isinstance(kwargs.get("qtables"), str) and kwargs["qtables"] in JPEG_PRESETS:
+        kwargs["qtables"] = scaled_qtables(kwargs["qtables"], kwargs.pop("quality"))
+    return kwargs
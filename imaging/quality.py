@@ -0,0 +1,166 @@
+import math
+import threading
+from io import BytesIO
+from typing import Callable, Dict, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageFilter, ImageStat
+
+from imaging.plan import Variant
+
+# The quality search runs on a reduced copy of at most this many pixels
+PROBE_PIXELS = 160_000
+MAX_SEARCH_STEPS = 6
+# Full-size re-encodes allowed when the probe under-predicts the byte size
+MAX_CORRECTIONS = 2
+# Mean edge strength thresholds separating flat, soft, detailed and busy content
+COMPLEXITY_THRESHOLDS = (4.0, 10.0, 20.0)
+
+# Learned per container: last chosen quality per (variant, content class)
+# and how much full-size output outweighs the area-scaled probe estimate
+_start_qualities: Dict[Tuple, int] = {}
+_size_ratios: Dict[Tuple, float] = {}
+_lock = threading.Lock()
+
+
+def psnr(a: Image.Image, b: Image.Image) -> float:
+    """Peak signal-to-noise ratio between two same-sized RGB images"""
+    sum2 = sum(ImageStat.Stat(ImageChops.difference(a, b)).sum2)
+    rms = math.sqrt(sum2 / (len(a.getbands()) * a.width * a.height))
+    return float("inf") if rms == 0 else 20 * math.log10(255 / rms)
+
+
+def content_class(image: Image.Image) -> int:
+    """Bucket an image by edge density, 0 (flat) to 3 (busy)"""
+    edges = image.convert("L").filter(ImageFilter.FIND_EDGES)
+    strength = ImageStat.Stat(edges).mean[0]
+    return sum(strength > threshold for threshold in COMPLEXITY_THRESHOLDS)
+
+
+def encode(
+    image: Image.Image, variant: Variant, quality: Optional[int] = None
+) -> BytesIO:
+    """Encode image with the variant's settings into a fresh buffer"""
+    buffer = BytesIO()
+    image.save(buffer, **variant.save_kwargs(quality))
+    return buffer
+
+
+class _Probe:
+    """A reduced copy of a variant image with memoized trial encodes
+
+    Images already within PROBE_PIXELS are probed as they are, so their
+    trial encodes are the full-size encodes.
+    """
+
+    def __init__(self, image: Image.Image, variant: Variant):
+        factor = math.ceil(math.sqrt(image.width * image.height / PROBE_PIXELS))
+        self.image = image.reduce(factor) if factor > 1 else image
+        self.area_ratio = (image.width * image.height) / (
+            self.image.width * self.image.height
+        )
+        self.variant = variant
+        self._encodes: Dict[int, BytesIO] = {}
+
+    def encode(self, quality: int) -> BytesIO:
+        if quality not in self._encodes:
+            self._encodes[quality] = encode(self.image, self.variant, quality)
+        return self._encodes[quality]
+
+    def nbytes(self, quality: int) -> int:
+        return self.encode(quality).getbuffer().nbytes
+
+    def psnr(self, quality: int) -> float:
+        buffer = self.encode(quality)
+        buffer.seek(0)
+        with Image.open(buffer) as decoded:
+            return psnr(self.image, decoded.convert(self.image.mode))
+
+
+def _search(
+    low: int, high: int, start: int, ok: Callable[[int], bool], highest: bool
+) -> int:
+    """Bounded binary search for the highest (or lowest) quality where ok() holds
+
+    ok must be monotonic over quality. Falls back to the bound that is
+    safest for the target when no probed quality satisfies it.
+    """
+    best = low if highest else high
+    mid = min(max(start, low), high)
+    for _ in range(MAX_SEARCH_STEPS):
+        if low > high:
+            break
+        if ok(mid):
+            best = mid
+            low, high = (mid + 1, high) if highest else (low, mid - 1)
+        else:
+            low, high = (low, mid - 1) if highest else (mid + 1, high)
+        mid = (low + high) // 2
+    return best
+
+
+def encode_variant(image: Image.Image, variant: Variant) -> BytesIO:
+    """Encode a variant, searching quality when it has a byte or PSNR target
+
+    The search runs on a downscaled probe, starting from the quality last
+    chosen for similar content, so meeting the target usually costs one
+    full-size encode.
+    """
+    if not variant.has_target:
+        return encode(image, variant)
+
+    probe = _Probe(image, variant)
+    key = (variant.id, content_class(probe.image))
+    with _lock:
+        start = _start_qualities.get(key, (variant.min_quality + variant.quality) // 2)
+        size_ratio = _size_ratios.get(key, 1.0)
+
+    def within_budget(quality_limit, ratio):
+        # Highest quality whose area-scaled probe size fits the byte budget
+        probe_budget = variant.max_bytes / (probe.area_ratio * ratio)
+        return _search(
+            variant.min_quality,
+            quality_limit,
+            min(start, quality_limit),
+            lambda q: probe.nbytes(q) <= probe_budget,
+            highest=True,
+        )
+
+    def encode_full(quality):
+        if probe.image is image:
+            return probe.encode(quality)
+        return encode(image, variant, quality)
+
+    quality = variant.quality
+    if variant.min_psnr is not None:
+        quality = _search(
+            variant.min_quality,
+            quality,
+            start,
+            lambda q: probe.psnr(q) >= variant.min_psnr,
+            highest=False,
+        )
+    if variant.max_bytes is not None:
+        # The byte budget wins when both targets cannot be met together
+        quality = within_budget(quality, size_ratio)
+
+    buffer = encode_full(quality)
+    size_ratio = buffer.getbuffer().nbytes / (probe.nbytes(quality) * probe.area_ratio)
+    if variant.max_bytes is not None:
+        for _ in range(MAX_CORRECTIONS):
+            if (
+                buffer.getbuffer().nbytes <= variant.max_bytes
+                or quality == variant.min_quality
+            ):
+                break
+            # Re-run the cheap probe search with the ratio this image just showed
+            quality = within_budget(quality - 1, size_ratio)
+            buffer = encode_full(quality)
+            size_ratio = buffer.getbuffer().nbytes / (
+                probe.nbytes(quality) * probe.area_ratio
+            )
+
+    with _lock:
+        _start_qualities[key] = quality
+        # Smoothed so one unusual image does not swing the next estimate
+        _size_ratios[key] = 0.7 * _size_ratios.get(key, size_ratio) + 0.3 * size_ratio
+    return buffer
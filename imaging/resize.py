@@ -0,0 +1,359 @@
+import math
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Container, Iterator, Optional, Tuple
+
+from PIL import Image
+
+from imaging.plan import ResizeNode, Variant, VariantPlan
+
+# Intermediates stay at least this many times larger than the next resize
+# target, which keeps the cheap draft/reduce steps visually lossless
+REDUCING_GAP = 2
+
+MB = 1024 * 1024
+# Target for one decoded source, including any mode conversion copy
+DECODE_MEMORY_LIMIT = int(os.environ.get("DECODE_MEMORY_LIMIT_MB", "256")) * MB
+# Sources above this are refused from the header alone, before any decoding.
+# Pillow's own default (~89 MP) would reject ordinary panoramas; the Lambda
+# raises Image.MAX_IMAGE_PIXELS to match
+MAX_SOURCE_PIXELS = int(os.environ.get("MAX_SOURCE_MEGAPIXELS", "400")) * 1_000_000
+# JPEG scales libjpeg can decode to directly
+DRAFT_SCALES = (1, 2, 4, 8)
+
+
+def fit_size(
+    source_size: Tuple[int, int], target_size: Tuple[int, int]
+) -> Tuple[int, int]:
+    """Largest size with the source aspect ratio that fits inside target_size"""
+    img_ratio = source_size[0] / source_size[1]
+    target_ratio = target_size[0] / target_size[1]
+
+    if img_ratio > target_ratio:
+        return target_size[0], int(target_size[0] / img_ratio)
+    return int(target_size[1] * img_ratio), target_size[1]
+
+
+def cover_size(
+    source_size: Tuple[int, int], target_size: Tuple[int, int]
+) -> Tuple[int, int]:
+    """Smallest size with the source aspect ratio that covers target_size"""
+    img_ratio = source_size[0] / source_size[1]
+    target_ratio = target_size[0] / target_size[1]
+
+    if img_ratio > target_ratio:
+        return max(target_size[0], round(target_size[1] * img_ratio)), target_size[1]
+    return target_size[0], max(target_size[1], round(target_size[0] / img_ratio))
+
+
+def node_size(node: ResizeNode, source_size: Tuple[int, int]) -> Tuple[int, int]:
+    """Size a node resizes to, before any crop or padding"""
+    if node.fit == "contain":
+        return fit_size(source_size, node.size)
+    if node.fit == "cover":
+        return cover_size(source_size, node.size)
+    return node.size
+
+
+def pad_to_canvas(resized: Image.Image, target_size: Tuple[int, int]) -> Image.Image:
+    """Center resized on a white canvas of target_size"""
+    final_image = Image.new("RGB", target_size, (255, 255, 255))
+    paste_x = (target_size[0] - resized.width) // 2
+    paste_y = (target_size[1] - resized.height) // 2
+    final_image.paste(resized, (paste_x, paste_y))
+    return final_image
+
+
+def reduce_towards(image: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """Box-reduce image by an integer factor while staying REDUCING_GAP times above size"""
+    factor = min(
+        image.width // (size[0] * REDUCING_GAP),
+        image.height // (size[1] * REDUCING_GAP),
+    )
+    return image.reduce(factor) if factor >= 2 else image
+
+
+def decoded_bytes(size: Tuple[int, int], mode: str) -> int:
+    """Memory Pillow allocates for an image of size and mode"""
+    # Pillow stores multi-band pixels (RGB included) in 32 bits
+    if mode in ("1", "L", "P"):
+        pixel_bytes = 1
+    elif mode.startswith("I;16"):
+        pixel_bytes = 2
+    else:
+        pixel_bytes = 4
+    return size[0] * size[1] * pixel_bytes
+
+
+def check_source_pixels(
+    img: Image.Image, limit: Optional[int] = MAX_SOURCE_PIXELS
+) -> None:
+    """Refuse img from its header if it exceeds limit pixels"""
+    # Image.open only reads the header, so this runs before any pixel data is
+    # decoded; Pillow itself merely warns below twice Image.MAX_IMAGE_PIXELS
+    pixels = img.width * img.height
+    if limit is not None and pixels > limit:
+        raise Image.DecompressionBombError(
+            f"Image size ({pixels} pixels) exceeds limit of {limit} pixels"
+        )
+
+
+def _decode_memory(size: Tuple[int, int], mode: str) -> int:
+    """Peak memory of decoding an image of size and mode to RGB"""
+    rgb = decoded_bytes(size, "RGB")
+    return rgb if mode == "RGB" else decoded_bytes(size, mode) + rgb
+
+
+def _scaled(size: Tuple[int, int], scale: int) -> Tuple[int, int]:
+    """size divided by scale, rounded up the way libjpeg and reduce() do"""
+    return math.ceil(size[0] / scale), math.ceil(size[1] / scale)
+
+
+def _draft_scale(img: Image.Image, largest: Tuple[int, int], memory_limit: int) -> int:
+    """Coarsest JPEG scale that serves largest, coarser still if memory requires"""
+    scale = max(
+        (
+            scale
+            for scale in DRAFT_SCALES
+            if img.width // scale >= largest[0] and img.height // scale >= largest[1]
+        ),
+        default=1,
+    )
+    for candidate in DRAFT_SCALES:
+        if candidate >= scale and (
+            _decode_memory(_scaled(img.size, candidate), img.mode) <= memory_limit
+        ):
+            return candidate
+    return DRAFT_SCALES[-1]
+
+
+def _largest_node(img: Image.Image, plan: VariantPlan) -> Tuple[int, int]:
+    return max(
+        (node_size(node, img.size) for node in plan.nodes),
+        key=lambda size: size[0] * size[1],
+    )
+
+
+def _raw_tiles(img: Image.Image) -> Optional[list]:
+    """img's tiles as (extents, offset, rawmode, stride, orientation), if all raw"""
+    tiles = []
+    for tile in img.tile:
+        codec, extents, offset, args = tile[:4]
+        if codec != "raw":
+            return None
+        if isinstance(args, str):
+            args = (args,)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+        width = extents[2] - extents[0]
+        if not stride:
+            try:
+                stride = len(Image.new(img.mode, (width, 1)).tobytes("raw", rawmode))
+            except ValueError:
+                return None
+        tiles.append((extents, offset, rawmode, stride, orientation))
+    return tiles
+
+
+def _read_band(img: Image.Image, tiles: list, top: int, bottom: int) -> Image.Image:
+    """Decode rows top..bottom of img's raw tiles as an RGB image"""
+    band = None
+    for (x0, y0, x1, y1), offset, rawmode, stride, orientation in tiles:
+        first, last = max(top, y0), min(bottom, y1)
+        if first >= last:
+            continue
+        # Bottom-up tiles (BMP) store their last row first
+        if orientation < 0:
+            img.fp.seek(offset + (y1 - last) * stride)
+        else:
+            img.fp.seek(offset + (first - y0) * stride)
+        piece = Image.frombytes(
+            img.mode,
+            (x1 - x0, last - first),
+            img.fp.read((last - first) * stride),
+            "raw",
+            rawmode,
+            stride,
+            orientation,
+        )
+        if piece.size == (img.width, bottom - top):
+            band = piece
+            break
+        if band is None:
+            band = Image.new(img.mode, (img.width, bottom - top))
+        band.paste(piece, (x0, first - top))
+    if img.mode == "P":
+        # From the header; getpalette() would decode the whole image
+        band.putpalette(*reversed(img.palette.getdata()))
+    return band if band.mode == "RGB" else band.convert("RGB")
+
+
+def _reduce_in_bands(
+    img: Image.Image, tiles: list, factor: int, memory_limit: int
+) -> Image.Image:
+    """Decode raw tiles a band of rows at a time, box-reducing each band by factor"""
+    reduced = Image.new("RGB", _scaled(img.size, factor))
+    # Whatever the reduced output leaves of the budget goes to the band: its
+    # raw bytes, the decoded rows and their RGB copy. Bands are whole
+    # multiples of factor so reduce boxes never straddle two bands
+    band_budget = max(memory_limit - decoded_bytes(reduced.size, "RGB"), 0)
+    row_bytes = max(stride for _, _, _, stride, _ in tiles) + _decode_memory(
+        (img.width, 1), img.mode
+    )
+    band_height = max(factor, band_budget // row_bytes // factor * factor)
+
+    for top in range(0, img.height, band_height):
+        # Nothing of a band outlives its iteration
+        band = _read_band(img, tiles, top, min(top + band_height, img.height))
+        reduced.paste(band.reduce(factor), (0, top // factor))
+        del band
+    return reduced
+
+
+class MemoryBudget:
+    """Decode memory shared by the conversions running at once
+
+    reserve() waits until its bytes are free, so a source that needs more
+    than its share runs once others have finished instead of failing.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.used = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        nbytes = min(nbytes, self.total)
+        with self._condition:
+            self._condition.wait_for(lambda: self.used + nbytes <= self.total)
+            self.used += nbytes
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.used -= nbytes
+                self._condition.notify_all()
+
+
+def planned_decode_memory(
+    img: Image.Image, plan: VariantPlan, memory_limit: Optional[int] = None
+) -> int:
+    """Memory decode_for_plan will take for img, from its header"""
+    if memory_limit is None:
+        memory_limit = DECODE_MEMORY_LIMIT
+    size = img.size
+    if img.format == "JPEG":
+        size = _scaled(size, _draft_scale(img, _largest_node(img, plan), memory_limit))
+    needed = _decode_memory(size, img.mode)
+    if needed > memory_limit and _raw_tiles(img) is not None:
+        return memory_limit
+    return needed
+
+
+def decode_for_plan(
+    img: Image.Image,
+    plan: VariantPlan,
+    memory_limit: Optional[int] = None,
+    max_memory: Optional[int] = None,
+) -> Image.Image:
+    """Decode img once, at the smallest scale that still serves every node
+
+    Decoding aims to stay under memory_limit (DECODE_MEMORY_LIMIT by
+    default): JPEGs pick a coarser draft scale and raw-tiled formats (BMP,
+    PPM, uncompressed TIFF) are reduced band by band. Other formats can only
+    be decoded in full; that raises MemoryError before a pixel is allocated
+    only if it would exceed max_memory (no cap by default).
+    """
+    if memory_limit is None:
+        memory_limit = DECODE_MEMORY_LIMIT
+    check_source_pixels(img)
+    largest = _largest_node(img, plan)
+
+    if img.format == "JPEG":
+        # libjpeg decodes straight to 1/2, 1/4 or 1/8 scale: never below the
+        # largest node unless that is what it takes to stay within budget
+        scale = _draft_scale(img, largest, memory_limit)
+        # draft() picks the scale from floor division, so ask in those terms
+        img.draft("RGB", (img.width // scale, img.height // scale))
+
+    needed = _decode_memory(img.size, img.mode)
+    tiles = _raw_tiles(img) if needed > memory_limit else None
+    if tiles is not None:
+        factor = max(
+            2,
+            min(
+                img.width // (largest[0] * REDUCING_GAP),
+                img.height // (largest[1] * REDUCING_GAP),
+            ),
+        )
+        # Half the budget for the output leaves room for the band being decoded
+        while decoded_bytes(_scaled(img.size, factor), "RGB") > memory_limit // 2:
+            factor += 1
+        return _reduce_in_bands(img, tiles, factor, memory_limit)
+    if max_memory is not None and needed > max_memory:
+        raise MemoryError(
+            f"Decoding {img.format} {img.width}x{img.height} needs more than "
+            f"{max_memory // MB} MB"
+        )
+
+    # Convert to RGB if necessary (Pillow operations typically need RGB)
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    img.load()
+    return img
+
+
+def run_resize_dag(
+    base: Image.Image,
+    original_size: Tuple[int, int],
+    plan: VariantPlan,
+    skip: Container = (),
+) -> Iterator[Tuple[ResizeNode, Optional[Image.Image]]]:
+    """Yield (node, resized image) in plan order, largest first
+
+    Each node resizes from its parent's output when that is safe, else from
+    the decoded source. Intermediates are dropped once no later node needs them.
+    A node whose variant ids are all in skip (rendered some other way) and
+    that no later node resizes from yields None instead of being resized.
+    """
+    remaining_children = Counter(node.parent for node in plan.nodes)
+    outputs = {}
+    for index, node in enumerate(plan.nodes):
+        resized = None
+        if remaining_children[index] or any(
+            variant.id not in skip for variant in node.variants
+        ):
+            size = node_size(node, original_size)
+            source = outputs.get(node.parent, base)
+            # Never resample from an upscaled intermediate or one that is too small
+            if (
+                source.width < size[0]
+                or source.height < size[1]
+                or source.width > base.width
+            ):
+                source = base
+            resized = reduce_towards(source, size).resize(
+                size, Image.Resampling.LANCZOS
+            )
+
+        if node.parent is not None:
+            remaining_children[node.parent] -= 1
+            if remaining_children[node.parent] == 0:
+                outputs.pop(node.parent, None)
+        if remaining_children[index]:
+            outputs[index] = resized
+
+        if resized is not None and node.fit == "cover":
+            left = (resized.width - node.width) // 2
+            top = (resized.height - node.height) // 2
+            resized = resized.crop((left, top, left + node.width, top + node.height))
+        yield node, resized
+
+
+def finish_variant(variant: Variant, resized: Image.Image) -> Image.Image:
+    """Apply the variant's final framing to its node output"""
+    if variant.fit == "pad":
+        return pad_to_canvas(resized, variant.size)
+    return resized
@@ -1,94 +1,379 @@
+import time
+
+# Captured before the heavy imports so cold-start cost includes them
+_MODULE_LOAD_STARTED = time.perf_counter()
+
 import os
-import boto3
+import json
+import importlib
+import resource
+from botocore.exceptions import ClientError
 from PIL import Image
-from io import BytesIO
 from pathlib import Path
+from urllib.parse import unquote_plus
+from concurrent.futures import ThreadPoolExecutor
+from imaging.animation import configure_gif_loading
+from imaging.dedup import (
+    DynamoDedupIndex, MemoryDedupIndex, S3DedupIndex, index_key, read_hashed, variant_label
+)
+from imaging.engine import ImageEngine, S3Sink
+from imaging.metrics import emf_line, sum_metrics
+from imaging.plan import load_plan
+from imaging.plugins import register_formats
+from imaging.resize import MAX_SOURCE_PIXELS, MemoryBudget
+
+# "lean" registers only the Pillow plugins the variant plan reads and writes and
+# leaves boto3 to the first S3 call; "full" loads boto3 and Pillow's common
+# decoders during the init phase, and any other plugin as Pillow meets it
+LAMBDA_STARTUP = os.environ.get('LAMBDA_STARTUP', 'full')
+# Records from one event converted in parallel; each one holds a decoded image
+MAX_RECORD_WORKERS = int(os.environ.get('MAX_RECORD_WORKERS', '4'))
+S3_MAX_POOL_CONNECTIONS = 32
+# Memory the records in flight may spend on decoded sources together: by
+# default half the function's memory
+DECODE_MEMORY_BUDGET = int(os.environ.get(
+    'DECODE_MEMORY_BUDGET_MB',
+    int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '1024')) // 2
+)) * 1024 * 1024
+# What one record's decode aims for (JPEG draft scale, band reduction): by
+# default the budget split across the records actually in flight. Sources
+# that cannot be decoded smaller wait for enough of the budget instead
+DECODE_MEMORY_LIMIT = (
+    int(os.environ['DECODE_MEMORY_LIMIT_MB']) * 1024 * 1024
+    if 'DECODE_MEMORY_LIMIT_MB' in os.environ else None
+)
+# Pillow warns from its default ~89 MP and refuses twice that on open; the
+# converter's own header check (MAX_SOURCE_MEGAPIXELS) applies instead
+Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS
+
+# Per-stage timings and byte counts are logged in CloudWatch embedded metric
+# format, which CloudWatch turns into metrics without any API calls
+EMIT_METRICS = os.environ.get('EMIT_METRICS', 'true').lower() not in ('0', 'false', 'no', 'off')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ImageConversion')
+
+# Where the content hash -> variant keys index lives: "s3" (JSON objects under
+# DEDUP_PREFIX in the destination bucket), "dynamodb" (the DEDUP_TABLE table),
+# "memory" (this container only) or "off"
+DEDUP_INDEX = os.environ.get('DEDUP_INDEX', 's3')
+DEDUP_PREFIX = os.environ.get('DEDUP_PREFIX', '.dedup/')
+DEDUP_TABLE = os.environ.get('DEDUP_TABLE')
 
-# Device viewport dimensions (width x height)
-DEVICE_VIEWPORTS = {
-    'laptop': (1920, 1080),    # Standard laptop/desktop
-    'tablet': (1024, 768),     # Standard tablet (landscape)
-    'mobile': (375, 667),      # Standard mobile (portrait)
-}
-
-def resize_image_smart(image, target_size, maintain_aspect=True):
-    """Resize image intelligently based on target size"""
-    if maintain_aspect:
-        img_ratio = image.width / image.height
-        target_ratio = target_size[0] / target_size[1]
-        
-        if img_ratio > target_ratio:
-            new_width = target_size[0]
-            new_height = int(target_size[0] / img_ratio)
+# Expensive state kept at module scope so warm invocations reuse it
+_s3_client = None
+_variant_plan = None
+_variant_executor = None
+_dedup_index = None
+_decode_budget = MemoryBudget(DECODE_MEMORY_BUDGET)
+_is_cold_start = True
+
+def get_s3_client():
+    """Return the container-wide S3 client, creating it on first use"""
+    global _s3_client
+    if _s3_client is None:
+        # Already imported at init unless the startup mode is lean
+        import boto3
+        from botocore.config import Config
+        # boto3 clients are thread-safe and pool connections per client
+        _s3_client = boto3.client(
+            's3', config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS)
+        )
+    return _s3_client
+
+def get_variant_plan():
+    """Return the compiled variant plan, loaded and compiled once per container"""
+    global _variant_plan
+    if _variant_plan is None:
+        _variant_plan = load_plan('lambda')
+    return _variant_plan
+
+def get_variant_executor():
+    """Return the container-wide pool that encodes and uploads variants"""
+    global _variant_executor
+    if _variant_executor is None:
+        # Encodes release the GIL inside the codec and uploads wait on the
+        # network, so by default every in-flight record can have all of its
+        # variants in progress at once
+        workers = int(os.environ.get(
+            'VARIANT_WORKERS', MAX_RECORD_WORKERS * len(get_variant_plan().variants)
+        ))
+        _variant_executor = ThreadPoolExecutor(max_workers=workers)
+    return _variant_executor
+
+def get_dedup_index(dest_bucket):
+    """Return the container-wide dedup index, or None when dedup is off"""
+    global _dedup_index
+    if _dedup_index is None and DEDUP_INDEX != 'off':
+        if DEDUP_INDEX == 'dynamodb':
+            import boto3
+            _dedup_index = DynamoDedupIndex(boto3.client('dynamodb'), DEDUP_TABLE)
+        elif DEDUP_INDEX == 'memory':
+            _dedup_index = MemoryDedupIndex()
         else:
-            new_height = target_size[1]
-            new_width = int(target_size[1] * img_ratio)
-            
-        resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        final_image = Image.new('RGB', target_size, (255, 255, 255))
-        paste_x = (target_size[0] - new_width) // 2
-        paste_y = (target_size[1] - new_height) // 2
-        final_image.paste(resized, (paste_x, paste_y))
-        
-        return final_image
-    else:
-        return image.resize(target_size, Image.Resampling.LANCZOS)
+            _dedup_index = S3DedupIndex(get_s3_client(), dest_bucket, DEDUP_PREFIX)
+    return _dedup_index
 
-def lambda_handler(event, context):
-    # Initialize S3 client
-    s3 = boto3.client('s3')
-    
-    # Extract source bucket and key from event
-    source_bucket = event['Records'][0]['s3']['bucket']['name']
-    source_key = event['Records'][0]['s3']['object']['key']
-    
-    # Destination configuration (modify as needed)
-    dest_bucket = 'converted-images02'  # Change to your destination bucket
-    dest_prefix = 'converted/'  # Optional prefix
-    
+def metric_dimensions(**extra):
+    """EMF dimensions: the function name when running in Lambda, plus extra"""
+    function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+    return {**({'FunctionName': function_name} if function_name else {}), **extra}
+
+def copy_variant(s3, variant, copy_source, etag, dest_bucket, dest_key, metadata):
+    """Server-side copy of an identical source's variant; runs on the variant pool
+
+    Only copies the object if it still has the ETag it was indexed with.
+    """
+    s3.copy_object(
+        Bucket=dest_bucket,
+        Key=dest_key,
+        CopySource=copy_source,
+        CopySourceIfMatch=etag,
+        MetadataDirective='REPLACE',
+        ContentType=variant.content_type,
+        Metadata=metadata
+    )
+    print(f"Copied {variant.name} {variant.format} version to s3://{dest_bucket}/{dest_key}")
+
+def copy_duplicate(s3, entry, plan, dest_bucket, dest_keys, metadata):
+    """Fill dest_keys by copying an index entry's variants
+
+    False if any is gone or was overwritten since it was indexed (its source
+    name was re-uploaded with other content), or the entry has no ETags to
+    check that against.
+    """
+    if 'etags' not in entry:
+        return False
+    futures = []
+    for variant in plan.variants:
+        label = variant_label(variant.id)
+        copy_source = {'Bucket': entry['bucket'], 'Key': entry['keys'][label]}
+        futures.append(get_variant_executor().submit(
+            copy_variant, s3, variant, copy_source, entry['etags'][label],
+            dest_bucket, dest_keys[variant.id], metadata
+        ))
     try:
-        # Get the image from S3
+        for future in futures:
+            future.result()
+    except ClientError as e:
+        # Deleted or overwritten since it was indexed; convert from scratch
+        print(f"Indexed variants unavailable: {str(e)}")
+        return False
+    return True
+
+def variant_is_current(s3, dest_bucket, dest_key, source_etag, fingerprint):
+    """Check with a HEAD request whether an output was built from this source and plan"""
+    try:
+        metadata = s3.head_object(Bucket=dest_bucket, Key=dest_key).get('Metadata', {})
+    except ClientError:
+        return False
+    return (metadata.get('source-etag') == source_etag
+            and metadata.get('variant-config') == fingerprint)
+
+def process_record(s3, record, plan, dest_bucket, dest_prefix, dedup_index=None,
+                   memory_limit=None):
+    """Convert the object referenced by one S3 event record into the plan's variants"""
+    source_bucket = record['s3']['bucket']['name']
+    # Keys arrive URL-encoded in S3 event notifications
+    source_key = unquote_plus(record['s3']['object']['key'])
+    fingerprint = plan.fingerprint
+
+    # Create destination keys
+    original_stem = Path(source_key).stem
+    dest_keys = {
+        variant.id: variant.key_for(original_stem, dest_prefix)
+        for variant in plan.variants
+    }
+
+    try:
+        # Events are delivered at least once and identical re-uploads keep
+        # their ETag, so a few HEADs can save a whole conversion
+        source_etag = record['s3']['object'].get('eTag')
+        if source_etag is None:
+            source_etag = s3.head_object(Bucket=source_bucket, Key=source_key)['ETag']
+        source_etag = source_etag.strip('"')
+        if all(get_variant_executor().map(
+                lambda dest_key: variant_is_current(
+                    s3, dest_bucket, dest_key, source_etag, fingerprint),
+                dest_keys.values())):
+            print(f"Skipping {source_key}: variants already up to date")
+            return {'key': source_key, 'status': 'skipped', 'variants': 0}
+
+        # Get the image from S3 into a single buffer, hashed as it downloads;
+        # the content hash lets duplicates under other names be recognised
+        started = time.perf_counter()
         response = s3.get_object(Bucket=source_bucket, Key=source_key)
-        image_content = response['Body'].read()
-        
-        # Process the image
-        with Image.open(BytesIO(image_content)) as img:
-            # Convert to RGB if necessary (Pillow operations typically need RGB)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Process each device size
-            for device, target_size in DEVICE_VIEWPORTS.items():
-                # Resize the image
-                converted_img = resize_image_smart(img, target_size)
-                
-                # Save to in-memory file
-                in_mem_file = BytesIO()
-                converted_img.save(in_mem_file, format='JPEG', quality=85)
-                in_mem_file.seek(0)
-                
-                # Create destination key
-                original_stem = Path(source_key).stem
-                dest_key = f"{dest_prefix}{original_stem}_{device}.jpg"
-                
-                # Upload to S3
-                s3.put_object(
-                    Bucket=dest_bucket,
-                    Key=dest_key,
-                    Body=in_mem_file,
-                    ContentType='image/jpeg'
-                )
-                print(f"Saved {device} version to s3://{dest_bucket}/{dest_key}")
-        
-        return {
-            'statusCode': 200,
-            'body': f"Successfully processed {source_key} into 3 versions"
+        source, content_hash = read_hashed(response['Body'], response['ContentLength'])
+        metrics = {
+            'downloadMs': (time.perf_counter() - started) * 1000,
+            'inputBytes': source.getbuffer().nbytes,
         }
-    
+        metadata = {
+            'source-etag': response['ETag'].strip('"'),
+            'variant-config': fingerprint,
+            'content-sha256': content_hash,
+        }
+
+        # The same bytes under another name: copy its variants server-side
+        # instead of decoding, resizing and encoding them again
+        content_key = index_key(fingerprint, content_hash)
+        entry = dedup_index.get(content_key) if dedup_index else None
+        if entry is not None:
+            started = time.perf_counter()
+            if copy_duplicate(s3, entry, plan, dest_bucket, dest_keys, metadata):
+                metrics['copyMs'] = (time.perf_counter() - started) * 1000
+                return {'key': source_key, 'status': 'deduplicated',
+                        'variants': len(plan.variants),
+                        'metrics': {name: round(value, 2) for name, value in metrics.items()}}
+            # Stale: drop it, and this conversion indexes the content afresh
+            try:
+                dedup_index.delete(content_key)
+            except Exception as e:
+                print(f"Could not drop stale index entry for {source_key}: {str(e)}")
+
+        # Decode and resize on this thread while earlier variants encode and
+        # upload on the variant pool, so CPU and network work overlap; the
+        # compressed bytes are released as soon as they are decoded
+        sink = S3Sink(s3, dest_bucket, metadata)
+        engine = ImageEngine(
+            plan, sink, get_variant_executor(), memory_limit, _decode_budget
+        )
+        conversion = engine.convert(source, dest_keys)
+        metrics.update(conversion.metrics)
+        for variant, sample in conversion.outputs:
+            print(f"Saved {variant.name} {variant.format} version to s3://{dest_bucket}/{dest_keys[variant.id]}")
+            if EMIT_METRICS:
+                print(emf_line(
+                    METRICS_NAMESPACE, sample,
+                    metric_dimensions(Variant=variant.name, Format=variant.format),
+                    {'key': source_key},
+                ))
+        metrics.update(sum_metrics(sample for _, sample in conversion.outputs))
+        if dedup_index is not None:
+            try:
+                # ETags let a later copy check the variants were not
+                # overwritten by a different source under the same name
+                dedup_index.put(content_key, {
+                    'bucket': dest_bucket,
+                    'keys': {variant_label(variant.id): dest_keys[variant.id]
+                             for variant in plan.variants},
+                    'etags': {variant_label(variant.id): sink.etags[dest_keys[variant.id]]
+                              for variant in plan.variants},
+                })
+            except Exception as e:
+                # Only later duplicates lose out; this record's variants are done
+                print(f"Could not index {source_key}: {str(e)}")
+        return {'key': source_key, 'status': 'ok', 'variants': len(plan.variants),
+                'metrics': {name: round(value, 2) for name, value in metrics.items()}}
+
     except Exception as e:
         print(f"Error processing {source_key}: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': f"Error processing {source_key}: {str(e)}"
-        }
\ No newline at end of file
+        return {'key': source_key, 'status': 'error', 'error': str(e)}
+
+def sqs_s3_records(message):
+    """S3 event records carried by one SQS message, directly or via SNS"""
+    body = json.loads(message['body'])
+    if 'Records' not in body and 'Message' in body:
+        body = json.loads(body['Message'])
+    # S3 sends an s3:TestEvent without Records when the notification is set up
+    return body.get('Records', [])
+
+def lambda_handler(event, context):
+    global _is_cold_start
+    handler_started = time.perf_counter()
+    cold_start = _is_cold_start
+    _is_cold_start = False
+
+    # Reuse the client and plan across warm invocations
+    s3 = get_s3_client()
+    plan = get_variant_plan()
+    get_variant_executor()
+    # Destination comes from the plan, with env overrides for per-stage deploys
+    dest_bucket = os.environ.get('DEST_BUCKET', plan.dest_bucket)
+    dest_prefix = os.environ.get('DEST_PREFIX', plan.dest_prefix)
+    dedup_index = get_dedup_index(dest_bucket)
+    lazy_init_ms = (time.perf_counter() - handler_started) * 1000
+
+    # S3 may batch several notifications into one event, so handle them all
+    records = event.get('Records', [])
+    # From an SQS trigger every message wraps its own S3 notification; their
+    # records are pooled so one invocation converts the whole batch at once
+    is_sqs = bool(records) and records[0].get('eventSource') == 'aws:sqs'
+    failed_messages = set()
+    if is_sqs:
+        messages, records = records, []
+        record_messages = []
+        for message in messages:
+            try:
+                message_records = sqs_s3_records(message)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                print(f"Unreadable message {message['messageId']}: {str(e)}")
+                failed_messages.add(message['messageId'])
+                continue
+            records.extend(message_records)
+            record_messages.extend([message['messageId']] * len(message_records))
+    results = []
+    if records:
+        in_flight = min(MAX_RECORD_WORKERS, len(records))
+        memory_limit = DECODE_MEMORY_LIMIT or DECODE_MEMORY_BUDGET // in_flight
+        with ThreadPoolExecutor(max_workers=in_flight) as executor:
+            results = list(executor.map(
+                lambda record: process_record(
+                    s3, record, plan, dest_bucket, dest_prefix, dedup_index, memory_limit),
+                records
+            ))
+
+    # Separate one-off cold-start cost from the warm path
+    invocation = {
+        'moduleInitMs': round(MODULE_INIT_MS, 2) if cold_start else 0.0,
+        'lazyInitMs': round(lazy_init_ms, 2),
+        'handlerMs': round((time.perf_counter() - handler_started) * 1000, 2),
+        'records': len(results),
+        'messages': len(messages) if is_sqs else 0,
+        # Container-wide high-water mark, comparable to Lambda's "Max Memory Used"
+        'maxRssMb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    if EMIT_METRICS:
+        # Stage totals over every converted record; encodes and uploads run
+        # concurrently, so their sums can exceed handlerMs
+        invocation.update(sum_metrics(result.get('metrics', {}) for result in results))
+        print(emf_line(
+            METRICS_NAMESPACE, invocation, metric_dimensions(), {'coldStart': cold_start}
+        ))
+    else:
+        print(json.dumps({'coldStart': cold_start, **invocation}))
+
+    failed = [result for result in results if result['status'] == 'error']
+    if not failed:
+        status_code = 200
+    elif len(failed) < len(results):
+        status_code = 207  # Partial success
+    else:
+        status_code = 500
+
+    response = {
+        'statusCode': status_code,
+        'body': f"Processed {len(results) - len(failed)} of {len(results)} records",
+        'results': results
+    }
+    if is_sqs:
+        # With ReportBatchItemFailures only these messages return to the
+        # queue; the rest of the batch is deleted as done
+        failed_messages.update(
+            message_id for message_id, result in zip(record_messages, results)
+            if result['status'] == 'error'
+        )
+        response['batchItemFailures'] = [
+            {'itemIdentifier': message['messageId']}
+            for message in messages if message['messageId'] in failed_messages
+        ]
+    return response
+
+if LAMBDA_STARTUP == 'lean' and get_variant_plan().formats is not None:
+    register_formats(get_variant_plan().formats)
+else:
+    # Register the common decoders (JPEG, PNG, GIF, BMP, PPM) and load boto3
+    # during the init phase
+    Image.preinit()
+    importlib.import_module('boto3')
+if get_variant_plan().formats is None or 'GIF' in get_variant_plan().formats:
+    configure_gif_loading()
+MODULE_INIT_MS = (time.perf_counter() - _MODULE_LOAD_STARTED) * 1000
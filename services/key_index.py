@@ -0,0 +1,66 @@
+from bisect import bisect_left
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+
+class KeyIndex:
+    """In-process search index over object keys for typeahead lookups
+
+    Keys are kept sorted case-insensitively so prefix queries are a bisect
+    plus a short walk. Substring queries run ``str.find`` over one
+    newline-joined, lowercased copy of all keys, which stays in C for the
+    whole scan and maps hits back to keys through a sorted offset table.
+    """
+
+    def __init__(self, keys: Iterable[str]):
+        self.keys = sorted(keys, key=str.lower)
+        self._lower_keys = [key.lower() for key in self.keys]
+        self._haystack = "\n".join(self._lower_keys) + "\n"
+
+        # Start offset of every key inside the haystack
+        self._offsets = [0] * len(self.keys)
+        position = 0
+        for i, lower_key in enumerate(self._lower_keys):
+            self._offsets[i] = position
+            position += len(lower_key) + 1
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def prefix_matches(self, prefix: str) -> Iterator[int]:
+        """Yield positions of keys starting with prefix, in sorted order"""
+        prefix = prefix.lower()
+        i = bisect_left(self._lower_keys, prefix)
+        while i < len(self._lower_keys) and self._lower_keys[i].startswith(prefix):
+            yield i
+            i += 1
+
+    def substring_matches(self, text: str) -> Iterator[int]:
+        """Yield positions of keys containing text, in sorted order"""
+        text = text.lower()
+        if "\n" in text:
+            return
+        start = 0
+        while True:
+            hit = self._haystack.find(text, start)
+            if hit < 0:
+                return
+            i = bisect_left(self._offsets, hit + 1) - 1
+            yield i
+            # Skip the rest of this key so each key is reported once
+            start = self._offsets[i] + len(self._lower_keys[i]) + 1
+
+    def search(self, query: str, limit: int = 50) -> List[str]:
+        """Return up to limit keys, prefix matches first, then other substring hits"""
+        if not query:
+            return self.keys[:limit]
+
+        positions = list(islice(self.prefix_matches(query), limit))
+        if len(positions) < limit:
+            seen = set(positions)
+            for i in self.substring_matches(query):
+                if i not in seen:
+                    positions.append(i)
+                    if len(positions) == limit:
+                        break
+        return [self.keys[i] for i in positions]
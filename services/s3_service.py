@@ -1,6 +1,54 @@
+import math
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError, NoCredentialsError
-from typing import List, Dict, Optional, Any
+from typing import Callable, List, Dict, Optional, Any
+from urllib.parse import quote
+
+MB = 1024 * 1024
+
+# Objects below this size go up in a single PUT
+MULTIPART_THRESHOLD = 8 * MB
+# S3 rejects multipart uploads with more parts than this
+MAX_MULTIPART_PARTS = 10000
+# Parts uploaded in parallel for a single large object
+MULTIPART_CONCURRENCY = 4
+# Enough pooled connections for several concurrent multipart uploads
+MAX_POOL_CONNECTIONS = 32
+
+
+def attachment_disposition(file_name: str) -> str:
+    """Content-Disposition that downloads as file_name, whatever characters it has
+
+    filename is an ASCII fallback with quotes and backslashes escaped;
+    filename* carries the exact name, UTF-8 and percent-encoded (RFC 5987).
+    """
+    fallback = "".join(char if " " <= char <= "~" else "_" for char in file_name)
+    fallback = fallback.replace("\\", "\\\\").replace('"', '\\"')
+    return (
+        f'attachment; filename="{fallback}"; '
+        f"filename*=UTF-8''{quote(file_name, safe='')}"
+    )
+
+
+def transfer_config_for_size(size: int) -> TransferConfig:
+    """Pick multipart settings suited to an object of the given size"""
+    if size < MULTIPART_THRESHOLD:
+        return TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD, max_concurrency=1, use_threads=False
+        )
+
+    # Grow the part size for very large objects so we stay under the part limit
+    chunksize = max(MULTIPART_THRESHOLD, math.ceil(size / MAX_MULTIPART_PARTS))
+    if size >= 1024 * MB:
+        chunksize = max(chunksize, 64 * MB)
+    parts = math.ceil(size / chunksize)
+    return TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD,
+        multipart_chunksize=chunksize,
+        max_concurrency=min(MULTIPART_CONCURRENCY, parts),
+    )
 
 
 class S3Manager:
@@ -18,6 +66,7 @@ class S3Manager:
                 aws_access_key_id=aws_access_key,
                 aws_secret_access_key=aws_secret_key,
                 region_name=region,
+                config=Config(max_pool_connections=MAX_POOL_CONNECTIONS),
             )
             # Test connection
             self.s3_client.list_buckets()
@@ -36,13 +85,13 @@ class S3Manager:
             raise Exception(f"Error listing buckets: {str(e)}")
 
     def list_objects(self, bucket_name: str, prefix: str = "") -> List[Dict]:
-        """List objects in the specified bucket"""
+        """List every object in the specified bucket, page by page"""
         try:
-            response = self.s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+            paginator = self.s3_client.get_paginator("list_objects_v2")
 
             objects = []
-            if "Contents" in response:
-                for obj in response["Contents"]:
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+                for obj in page.get("Contents", []):
                     objects.append(
                         {
                             "Key": obj["Key"],
@@ -55,10 +104,20 @@ class S3Manager:
         except Exception as e:
             raise Exception(f"Error listing objects: {str(e)}")
 
-    def upload_file(self, bucket_name: str, file_obj, object_name: str) -> bool:
-        """Upload a file to S3 bucket"""
+    def upload_file(
+        self,
+        bucket_name: str,
+        file_obj,
+        object_name: str,
+        size: Optional[int] = None,
+        callback: Optional[Callable[[int], None]] = None,
+    ) -> bool:
+        """Upload a file to S3 bucket, using multipart settings suited to its size"""
         try:
-            self.s3_client.upload_fileobj(file_obj, bucket_name, object_name)
+            config = transfer_config_for_size(size) if size is not None else None
+            self.s3_client.upload_fileobj(
+                file_obj, bucket_name, object_name, Callback=callback, Config=config
+            )
             return True
         except Exception as e:
             raise Exception(f"Error uploading file: {str(e)}")
@@ -71,6 +130,24 @@ class S3Manager:
         except Exception as e:
             raise Exception(f"Error downloading file: {str(e)}")
 
+    def generate_download_url(
+        self, bucket_name: str, object_name: str, expires_in: int = 3600
+    ) -> str:
+        """Create a presigned URL that downloads the object straight from S3"""
+        try:
+            file_name = object_name.rsplit("/", 1)[-1]
+            return self.s3_client.generate_presigned_url(
+                "get_object",
+                Params={
+                    "Bucket": bucket_name,
+                    "Key": object_name,
+                    "ResponseContentDisposition": attachment_disposition(file_name),
+                },
+                ExpiresIn=expires_in,
+            )
+        except Exception as e:
+            raise Exception(f"Error creating download link: {str(e)}")
+
     def delete_file(self, bucket_name: str, object_name: str) -> bool:
         """Delete a file from S3 bucket"""
         try:
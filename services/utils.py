@@ -1,12 +1,25 @@
+import re
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".tiff", ".webp"]
+SIZE_UNITS = ["B", "KB", "MB", "GB", "TB"]
+IMAGE_LABEL = "🖼️ Image"
+FILE_LABEL = "📄 File"
+
+_IMAGE_KEY_PATTERN = "(" + "|".join(re.escape(ext) for ext in IMAGE_EXTENSIONS) + ")$"
 
 
 def format_file_size(size_bytes: int) -> str:
     """Convert bytes to human readable format"""
     if size_bytes == 0:
         return "0 B"
-    size_names = ["B", "KB", "MB", "GB", "TB"]
+    size_names = SIZE_UNITS
     i = 0
     while size_bytes >= 1024 and i < len(size_names) - 1:
         size_bytes /= 1024.0
@@ -26,3 +39,51 @@ def format_file_info(file_info: Dict[str, Any]) -> Dict[str, Any]:
         "ETag": file_info["ETag"].strip('"'),
         "StorageClass": file_info.get("StorageClass", "STANDARD"),
     }
+
+
+def format_file_sizes(sizes) -> pa.Array:
+    """Vectorized format_file_size over an array of byte counts"""
+    sizes = np.asarray(sizes, dtype=np.int64)
+    exponent = np.zeros(len(sizes), dtype=np.int64)
+    for i in range(1, len(SIZE_UNITS)):
+        exponent += sizes >= 1024**i
+
+    # Round to tenths once, then assemble "<int>.<tenth> <unit>" column-wise
+    tenths = np.rint(sizes / np.power(1024.0, exponent) * 10).astype(np.int64)
+    numbers = pc.binary_join_element_wise(
+        pa.array(tenths // 10).cast(pa.string()),
+        pa.array(tenths % 10).cast(pa.string()),
+        ".",
+    )
+    units = pa.array(SIZE_UNITS).take(pa.array(exponent))
+    formatted = pc.binary_join_element_wise(numbers, units, " ")
+    return pc.if_else(pa.array(sizes == 0), pa.scalar("0 B"), formatted)
+
+
+def is_image_keys(keys: pa.Array) -> pa.Array:
+    """Vectorized image-extension check over an array of object keys"""
+    return pc.match_substring_regex(keys, _IMAGE_KEY_PATTERN, ignore_case=True)
+
+
+def build_files_table(objects: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Build the pyarrow-backed file details table, images first"""
+    keys = pa.array([obj["Key"] for obj in objects], pa.string())
+    sizes = np.fromiter((obj["Size"] for obj in objects), np.int64, len(objects))
+    modified = pa.array(
+        [obj["LastModified"] for obj in objects], pa.timestamp("s", tz="UTC")
+    )
+    storage_classes = pa.array([obj["StorageClass"] for obj in objects], pa.string())
+
+    is_image = is_image_keys(keys)
+    table = pa.table(
+        {
+            "Type": pc.if_else(is_image, IMAGE_LABEL, FILE_LABEL),
+            "File Name": keys,
+            "Size": format_file_sizes(sizes),
+            "Last Modified": modified,
+            "Storage Class": storage_classes,
+        }
+    )
+    # Stable sort keeps listing order within the image and non-image groups
+    order = np.argsort(~is_image.to_numpy(zero_copy_only=False), kind="stable")
+    return table.take(pa.array(order)).to_pandas(types_mapper=pd.ArrowDtype)